@@ -98,3 +98,114 @@ PERFORMANCE = {
     'batch_size': 100,   # process texts in batches
     'timeout_seconds': 30
 }
+
+# Segment deduplication for token counting
+DEDUP = {
+    'avg_segment_lines': 16,     # expected lines per content-defined segment (power of two)
+    'min_segment_lines': 4,      # never cut a segment shorter than this
+    'max_segment_lines': 256,    # force a cut at the next safe line after this
+    'table_size': 100000,        # segment counts kept in the shared table
+    'clean_cut_encodings': ['cl100k_base', 'o200k_base']  # never merge tokens across a cut
+}
+
+# Note storage
+STORAGE = {
+    'data_dir': '.notemind',     # where notes and indexes are kept
+    'segment_bytes': 64 * 1024 * 1024,  # start a new segment file after this size
+    'compact_ratio': 0.5         # compact once this fraction of stored bytes is dead
+}
+
+# Semantic search
+SEARCH = {
+    'chunk_tokens': 256,         # tokens per indexed chunk
+    'embedding_dim': 128,        # dimensions of the hashing embedder
+    'top_k': 5,                  # results returned by default
+    'block_rows': 65536,         # index rows scored per matrix product
+    'compact_ratio': 0.5         # rewrite the index once this fraction of rows is removed
+}
+
+# Keyword search
+KEYWORD = {
+    'k1': 1.2,                   # BM25 term frequency saturation
+    'b': 0.75,                   # BM25 document length normalisation
+    'snippet_tokens': 40         # token budget for result snippets
+}
+
+# Summarization
+SUMMARY = {
+    'summary_tokens': 200,       # output tokens requested per summary call
+    'max_workers': 4,            # concurrent map calls
+    'max_cost': None             # stop before a run would exceed this many dollars
+}
+
+# Model backends
+MODEL_CLIENT = {
+    'backend': 'local',          # 'local' (offline fake) or 'openai'
+    'api_url': 'https://api.openai.com/v1/chat/completions',
+    'temperature': 0.3,
+    'top_p': 1.0,
+    'top_k': None
+}
+
+# Provider rate limits per model ('default' applies to unlisted models)
+RATE_LIMITS = {
+    'default': {'requests_per_minute': 500, 'tokens_per_minute': 60000},
+    'gpt-3.5-turbo': {'requests_per_minute': 3500, 'tokens_per_minute': 90000},
+    'gpt-4': {'requests_per_minute': 500, 'tokens_per_minute': 10000},
+    'claude-3-sonnet': {'requests_per_minute': 50, 'tokens_per_minute': 40000}
+}
+
+# Request scheduling
+SCHEDULER = {
+    'max_concurrency': 8,        # model calls in flight at once
+    'coalesce_max_tokens': 300,  # requests up to this weight may share a prompt
+    'batch_max_tokens': 2000,    # weight limit of a coalesced prompt
+    'batch_max_requests': 8,     # requests per coalesced prompt
+    'coalesce_wait': 0.02,       # seconds to wait for requests to coalesce with
+    'max_retries': 3             # retries after a rate limit response
+}
+
+# Watch mode
+WATCH = {
+    'extensions': ['.md', '.txt'],  # files treated as notes
+    'poll_interval': 1.0,        # seconds between directory scans
+    'debounce_seconds': 0.5,     # wait until a file has been quiet this long
+    'batch_size': 64,            # files processed per batch
+    'max_workers': 4             # threads reading and encoding changed files
+}
+
+# Prompt compaction before truncation
+COMPACTION = {
+    'steps': ['whitespace', 'repeats', 'markdown', 'references'],  # applied in order
+    'optimize_steps': ['whitespace', 'repeats', 'markdown'],  # used by optimize_prompt
+    'min_line_chars': 20,        # shorter repeated lines (e.g. "}") are kept
+    'min_reference_chars': 40    # shortest URL or ID worth a placeholder
+}
+
+# Multi-process encoding
+PARALLEL = {
+    'processes': None,           # worker processes (None uses every core)
+    'piece_bytes': 1024 * 1024,  # largest piece of a document sent to one worker
+    'min_piece_bytes': 64 * 1024,  # smaller documents are not split
+    'start_method': None         # multiprocessing start method (None uses the platform default)
+}
+
+# Model response cache
+RESPONSE_CACHE = {
+    'max_entries': 10000,        # responses kept at most
+    'max_bytes': 64 * 1024 * 1024,  # total size of cached responses
+    'ttl_seconds': 7 * 24 * 3600,   # responses expire this long after they were stored
+    'near_duplicates': False,    # also answer prompts that are almost identical to a cached one
+    'similarity': 0.9,           # estimated Jaccard similarity a near duplicate needs
+    'num_perm': 64,              # MinHash signature length
+    'bands': 16,                 # LSH bands (num_perm must be divisible by this)
+    'shingle_tokens': 3,         # prompt tokens per shingle
+    'eviction_sample': 8         # least recently used entries weighed against each other on eviction
+}
+
+# Streaming export
+EXPORT = {
+    'format': 'json',            # 'json', 'jsonl', 'markdown' or 'text'
+    'buffer_bytes': 1024 * 1024,  # serialized output gathered before each write
+    'serializer': 'auto'         # 'orjson', 'json' or 'auto' (orjson when installed)
+}
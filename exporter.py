@@ -0,0 +1,234 @@
+"""
+Streaming export of records as JSON, JSON Lines, Markdown or text.
+
+Records are written straight from a generator as they are produced, so
+exporting a whole vault or a long chunk list never holds more than one
+record and one output buffer in memory. Serialized output is gathered into
+a buffer of buffer_bytes and written in a single call once it fills.
+orjson serializes records when it is installed; otherwise the json module
+produces the same compact output.
+"""
+
+import io
+import json
+import sys
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from config import EXPORT
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FORMATS = ['json', 'jsonl', 'markdown', 'text']
+
+# Dict fields written as paragraphs under a Markdown heading, not as list items
+MARKDOWN_BODY = ['summary', 'text', 'chunk']
+
+
+def _default(obj):
+    """Serialize NumPy scalars and arrays."""
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _json_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'),
+                      default=_default).encode('utf-8')
+
+
+def _orjson_dumps(obj: Any) -> bytes:
+    return orjson.dumps(obj, default=_default,
+                        option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+
+def get_serializer(name: str = EXPORT['serializer']) -> Callable[[Any], bytes]:
+    """Return a function serializing one value to compact UTF-8 JSON."""
+    if name == 'auto':
+        name = 'json' if orjson is None else 'orjson'
+    if name == 'orjson':
+        if orjson is None:
+            raise ValueError("orjson is not installed")
+        return _orjson_dumps
+    if name == 'json':
+        return _json_dumps
+    raise ValueError(f"Unknown serializer {name}")
+
+
+class Exporter:
+    """Writes a stream of records to a file or stdout in one format."""
+
+    def __init__(self, out=None, fmt: str = EXPORT['format'],
+                 buffer_bytes: int = EXPORT['buffer_bytes'],
+                 serializer: str = EXPORT['serializer']):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown export format {fmt}")
+        if buffer_bytes < 1:
+            raise ValueError("buffer_bytes must be positive")
+        self.fmt = fmt
+        self.buffer_bytes = buffer_bytes
+        self.dumps = get_serializer(serializer)
+        self.bytes_written = 0
+        self._parts = []
+        self._size = 0
+
+        self._owned = isinstance(out, str)
+        if out is None:
+            out = sys.stdout
+        elif self._owned:
+            out = open(out, 'wb')
+        if isinstance(out, io.TextIOBase):
+            # Write bytes underneath text streams, after what they already hold
+            out.flush()
+            text = out
+            out = getattr(text, 'buffer', None)
+            if out is None:
+                self._write = lambda data: text.write(data.decode('utf-8'))
+        if out is not None:
+            self._write = out.write
+        self.out = out
+
+    def _emit(self, data: bytes):
+        self._parts.append(data)
+        self._size += len(data)
+        if self._size >= self.buffer_bytes:
+            self.flush()
+
+    def flush(self):
+        """Write buffered output."""
+        if self._parts:
+            data = b"".join(self._parts)
+            self._write(data)
+            self.bytes_written += len(data)
+            self._parts = []
+            self._size = 0
+        if self.out is not None:
+            self.out.flush()
+
+    def close(self):
+        """Flush and close the output file if the exporter opened it."""
+        self.flush()
+        if self._owned:
+            self.out.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, items: Iterable, fields: Optional[Dict[str, Any]] = None,
+              key: Optional[str] = None, count_field: Optional[str] = None,
+              title: Optional[str] = None, label: Optional[str] = None) -> int:
+        """Write records from items, consuming them one at a time.
+
+        JSON exports are an array, or an object holding fields and the
+        array under key with its length under count_field. JSON Lines
+        writes one record per line and leaves fields out. Markdown puts
+        each record under a heading of label and its id or position.
+        Returns the number of records written.
+        """
+        if self.fmt == 'json':
+            count = self._write_json(items, fields, key, count_field)
+        elif self.fmt == 'jsonl':
+            count = 0
+            for item in items:
+                self._emit(self.dumps(item) + b"\n")
+                count += 1
+        elif self.fmt == 'markdown':
+            count = self._write_markdown(items, fields, count_field, title, label)
+        else:
+            count = self._write_text(items, fields, key, count_field)
+        self.flush()
+        return count
+
+    def _write_json(self, items, fields, key, count_field) -> int:
+        dumps = self.dumps
+        wrapped = fields is not None or key is not None or count_field is not None
+        if wrapped:
+            self._emit(b"{")
+            for name, value in (fields or {}).items():
+                self._emit(b"\n  " + dumps(name) + b": " + dumps(value) + b",")
+            self._emit(b"\n  " + dumps(key or 'items') + b": [")
+            indent = b"\n    "
+        else:
+            self._emit(b"[")
+            indent = b"\n  "
+
+        count = 0
+        for item in items:
+            self._emit((indent if count == 0 else b"," + indent) + dumps(item))
+            count += 1
+        if count:
+            self._emit(indent[:-2])
+        self._emit(b"]")
+
+        if wrapped:
+            if count_field:
+                self._emit(b",\n  " + dumps(count_field) + b": " + dumps(count))
+            self._emit(b"\n}")
+        self._emit(b"\n")
+        return count
+
+    def _write_markdown(self, items, fields, count_field, title, label) -> int:
+        if title:
+            self._emit(f"# {title}\n\n".encode('utf-8'))
+        if fields:
+            self._emit((self._markdown_list(fields) + "\n").encode('utf-8'))
+
+        count = 0
+        for item in items:
+            count += 1
+            if label:
+                number = count
+                if isinstance(item, dict) and 'id' in item:
+                    item = dict(item)
+                    number = item.pop('id')
+                self._emit(f"## {label} {number}\n\n".encode('utf-8'))
+            self._emit(self._markdown_item(item))
+
+        if count_field:
+            self._emit(self._markdown_list({count_field: count}).encode('utf-8'))
+        return count
+
+    def _markdown_list(self, fields: Dict[str, Any]) -> str:
+        return "".join(f"- **{name}**: {value}\n" for name, value in fields.items())
+
+    def _markdown_item(self, item) -> bytes:
+        if not isinstance(item, dict):
+            return f"{item}\n\n".encode('utf-8')
+        parts = []
+        listed = {name: value for name, value in item.items()
+                  if name not in MARKDOWN_BODY and value is not None}
+        if listed:
+            parts.append(self._markdown_list(listed) + "\n")
+        for name in MARKDOWN_BODY:
+            value = item.get(name)
+            if not value:
+                continue
+            if name == 'summary':
+                value = "\n".join("> " + line for line in str(value).splitlines())
+            parts.append(f"{value}\n\n")
+        return "".join(parts).encode('utf-8')
+
+    def _write_text(self, items, fields, key, count_field) -> int:
+        for name, value in (fields or {}).items():
+            self._emit(f"{name}: {value}\n".encode('utf-8'))
+        if key:
+            self._emit(f"{key}:\n".encode('utf-8'))
+        count = 0
+        for item in items:
+            count += 1
+            line = f"  {count}: {item}\n" if key else f"{item}\n"
+            self._emit(line.encode('utf-8'))
+        if count_field:
+            self._emit(f"{count_field}: {count}\n".encode('utf-8'))
+        return count
+
+
+def export(items: Iterable, out=None, fmt: str = EXPORT['format'], **kwargs) -> int:
+    """Stream items to out (a path, binary or text stream; stdout by default)."""
+    with Exporter(out, fmt) as exporter:
+        return exporter.write(items, **kwargs)
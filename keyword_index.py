@@ -0,0 +1,284 @@
+"""
+Inverted keyword index for lexical note search.
+
+Postings are stored on disk as delta-encoded varint blocks. Every add
+appends one block per term plus a line to the term dictionary log, so
+indexing a note never rewrites existing data; compact() merges the blocks
+of each term into one. Re-adding a note supersedes the postings written
+for it before, and remove() drops a note without touching the postings.
+"""
+
+import heapq
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Tuple
+
+from config import KEYWORD
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase index terms."""
+    return WORD_PATTERN.findall(text.lower())
+
+
+def encode_varints(values: Iterable[int]) -> bytes:
+    """Encode non-negative integers as LEB128 varints."""
+    out = bytearray()
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+
+def decode_varints(data: bytes) -> List[int]:
+    """Decode a sequence of LEB128 varints."""
+    values = []
+    value = 0
+    shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = 0
+            shift = 0
+    return values
+
+
+def encode_postings(postings: List[Tuple[int, int]]) -> bytes:
+    """Encode sorted (doc_id, term_frequency) pairs as one block."""
+    values = [len(postings)]
+    previous = 0
+    for doc_id, _ in postings:
+        values.append(doc_id - previous)
+        previous = doc_id
+    values.extend(tf for _, tf in postings)
+    return encode_varints(values)
+
+
+def decode_postings(data: bytes) -> List[Tuple[int, int]]:
+    """Decode a block written by encode_postings."""
+    values = decode_varints(data)
+    count = values[0]
+    doc_ids = []
+    doc_id = 0
+    for delta in values[1:count + 1]:
+        doc_id += delta
+        doc_ids.append(doc_id)
+    return list(zip(doc_ids, values[count + 1:2 * count + 1]))
+
+
+@dataclass
+class KeywordResult:
+    """A note matching a keyword query."""
+    note_id: int
+    score: float
+
+
+class KeywordIndex:
+    """On-disk inverted index with BM25 scoring."""
+
+    def __init__(self, data_dir: str, k1: float = KEYWORD['k1'], b: float = KEYWORD['b']):
+        self.data_dir = data_dir
+        self.postings_path = os.path.join(data_dir, 'keywords.postings')
+        self.terms_path = os.path.join(data_dir, 'keywords.terms')
+        self.docs_path = os.path.join(data_dir, 'keywords.doclog')
+        self.k1 = k1
+        self.b = b
+
+        # term -> [(offset, length), ...] of posting blocks
+        self.terms: Dict[str, List[Tuple[int, int]]] = {}
+        self.doc_lengths: Dict[int, int] = {}
+        # note_id -> postings offset where its current version starts
+        self.doc_starts: Dict[int, int] = {}
+        self.total_length = 0
+        self._load()
+
+    def _load(self):
+        """Read the term dictionary and document lengths."""
+        if os.path.exists(self.terms_path):
+            with open(self.terms_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    term, offset, length = line.rstrip('\n').split('\t')
+                    self.terms.setdefault(term, []).append((int(offset), int(length)))
+
+        if os.path.exists(self.docs_path):
+            # (note_id, length + 1, postings start) triples; length 0 marks a removal
+            with open(self.docs_path, 'rb') as f:
+                values = decode_varints(f.read())
+            for doc_id, length, start in zip(values[::3], values[1::3], values[2::3]):
+                if length:
+                    self.doc_lengths[doc_id] = length - 1
+                    self.doc_starts[doc_id] = start
+                else:
+                    self.doc_lengths.pop(doc_id, None)
+                    self.doc_starts.pop(doc_id, None)
+        self.total_length = sum(self.doc_lengths.values())
+
+    def add(self, note_id: int, text: str):
+        """Index a single note."""
+        self.add_many([(note_id, text)])
+
+    def add_many(self, notes: List[Tuple[int, str]]):
+        """Index several notes, appending one block per term."""
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        lengths = []
+        for note_id, text in sorted(notes):
+            words = tokenize(text)
+            lengths.extend((note_id, len(words)))
+            for term, tf in Counter(words).items():
+                postings.setdefault(term, []).append((note_id, tf))
+
+        os.makedirs(self.data_dir, exist_ok=True)
+        with open(self.postings_path, 'ab') as data, \
+                open(self.terms_path, 'a', encoding='utf-8') as terms:
+            offset = start = data.tell()
+            for term, term_postings in postings.items():
+                block = encode_postings(term_postings)
+                data.write(block)
+                terms.write(f"{term}\t{offset}\t{len(block)}\n")
+                self.terms.setdefault(term, []).append((offset, len(block)))
+                offset += len(block)
+
+        self._log_docs([(note_id, length + 1, start)
+                        for note_id, length in zip(lengths[::2], lengths[1::2])])
+        for note_id, length in zip(lengths[::2], lengths[1::2]):
+            self.total_length += length - self.doc_lengths.get(note_id, 0)
+            self.doc_lengths[note_id] = length
+            self.doc_starts[note_id] = start
+
+    def remove(self, note_ids: Iterable[int]):
+        """Drop notes from the index; their postings are skipped from now on."""
+        removed = [note_id for note_id in note_ids if note_id in self.doc_lengths]
+        if not removed:
+            return
+        self._log_docs([(note_id, 0, 0) for note_id in removed])
+        for note_id in removed:
+            self.total_length -= self.doc_lengths.pop(note_id)
+            del self.doc_starts[note_id]
+
+    def _log_docs(self, entries: List[Tuple[int, int, int]]):
+        with open(self.docs_path, 'ab') as f:
+            f.write(encode_varints(value for entry in entries for value in entry))
+
+    def _rewrite_docs(self):
+        """Write the live document table as a fresh log."""
+        tmp_path = self.docs_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(encode_varints(value for note_id in sorted(self.doc_lengths)
+                                   for value in (note_id, self.doc_lengths[note_id] + 1,
+                                                 self.doc_starts[note_id])))
+        os.replace(tmp_path, self.docs_path)
+
+    def postings(self, term: str) -> List[Tuple[int, int]]:
+        """Return all (note_id, term_frequency) pairs for a term."""
+        blocks = self.terms.get(term)
+        if not blocks:
+            return []
+
+        result = []
+        starts = self.doc_starts
+        with open(self.postings_path, 'rb') as f:
+            for offset, length in blocks:
+                f.seek(offset)
+                # Skip postings of removed notes and of superseded versions
+                result.extend(posting for posting in decode_postings(f.read(length))
+                              if starts.get(posting[0], offset + 1) <= offset)
+        return result
+
+    def search(self, query: str, k: int = 5) -> List[KeywordResult]:
+        """Return the k notes with the highest BM25 score for a query."""
+        doc_count = len(self.doc_lengths)
+        if not doc_count:
+            return []
+        average_length = self.total_length / doc_count
+
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for note_id, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[note_id] / average_length)
+                scores[note_id] = scores.get(note_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [KeywordResult(note_id=note_id, score=score) for note_id, score in best]
+
+    def compact(self):
+        """Rewrite the index with a single posting block per term."""
+        os.makedirs(self.data_dir, exist_ok=True)
+        merged_terms = {}
+        tmp_postings = self.postings_path + '.tmp'
+        tmp_terms = self.terms_path + '.tmp'
+        with open(tmp_postings, 'wb') as data, open(tmp_terms, 'w', encoding='utf-8') as terms:
+            for term in self.terms:
+                term_postings = sorted(self.postings(term))
+                if not term_postings:
+                    continue
+                block = encode_postings(term_postings)
+                offset = data.tell()
+                data.write(block)
+                terms.write(f"{term}\t{offset}\t{len(block)}\n")
+                merged_terms[term] = [(offset, len(block))]
+        os.replace(tmp_postings, self.postings_path)
+        os.replace(tmp_terms, self.terms_path)
+        self.terms = merged_terms
+        self.doc_starts = dict.fromkeys(self.doc_lengths, 0)
+        self._rewrite_docs()
+
+    def snippet(self, token_mgr, text: str, query: str,
+                max_tokens: int = KEYWORD['snippet_tokens'], model: str = 'gpt-3.5-turbo') -> str:
+        """Return the part of text around the first query match within a token budget."""
+        words = text.split()
+        if not words:
+            return ""
+
+        query_terms = set(tokenize(query))
+        center = 0
+        for i, word in enumerate(words):
+            if query_terms.intersection(tokenize(word)):
+                center = i
+                break
+
+        # Grow a window around the match one word at a time; a word with a
+        # leading space costs about as much as it does inside the snippet.
+        start = end = center
+        used = token_mgr.count_tokens(words[center], model)
+        grew = True
+        while grew:
+            grew = False
+            for side in (1, -1):
+                i = end + 1 if side > 0 else start - 1
+                if i < 0 or i >= len(words):
+                    continue
+                cost = token_mgr.count_tokens(" " + words[i], model)
+                if used + cost > max_tokens:
+                    continue
+                used += cost
+                if side > 0:
+                    end = i
+                else:
+                    start = i
+                grew = True
+
+        snippet = " ".join(words[start:end + 1])
+        while end > start and token_mgr.count_tokens(snippet, model) > max_tokens:
+            if end - center >= center - start:
+                end -= 1
+            else:
+                start += 1
+            snippet = " ".join(words[start:end + 1])
+        return snippet
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
@@ -0,0 +1,132 @@
+"""
+Model clients used by the NoteMind pipelines.
+
+Pipelines only depend on ModelClient.complete(), so the OpenAI backend can
+be swapped for the local backend in tests and offline use.
+"""
+
+import os
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+from config import MODEL_CLIENT, PERFORMANCE
+
+
+class RateLimitError(Exception):
+    """Raised when the provider rejects a call for exceeding its rate limits."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass
+class Completion:
+    """Text returned by a model call along with its token usage."""
+    text: str
+    input_tokens: int
+    output_tokens: int
+    model: str
+    cached: bool = False         # served from a response cache, not the provider
+
+
+class ModelClient(ABC):
+    """Base class for model backends."""
+
+    @abstractmethod
+    def complete(self, prompt: str, model: str, max_tokens: int,
+                 temperature: float = MODEL_CLIENT['temperature'],
+                 top_p: float = MODEL_CLIENT['top_p'],
+                 top_k: Optional[int] = MODEL_CLIENT['top_k']) -> Completion:
+        """Run a single prompt and return the completion."""
+
+
+class LocalModelClient(ModelClient):
+    """Offline backend that answers with an extract of the prompt content.
+
+    The content is everything after the first blank line of the prompt; the
+    reply is its leading words, capped at max_tokens. Calls are recorded so
+    tests can check what was sent.
+    """
+
+    def __init__(self, token_mgr=None, respond: Optional[Callable[[str, int], str]] = None):
+        self.token_mgr = token_mgr
+        self.respond = respond or self._extract
+        self.calls: List[Dict] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _extract(prompt: str, max_tokens: int) -> str:
+        content = prompt.split("\n\n", 1)[-1]
+        return " ".join(content.split()[:max_tokens])
+
+    def _count(self, text: str, model: str) -> int:
+        if self.token_mgr is not None:
+            return self.token_mgr.count_tokens(text, model)
+        return len(text.split())
+
+    def complete(self, prompt: str, model: str, max_tokens: int,
+                 temperature: float = MODEL_CLIENT['temperature'],
+                 top_p: float = MODEL_CLIENT['top_p'],
+                 top_k: Optional[int] = MODEL_CLIENT['top_k']) -> Completion:
+        text = self.respond(prompt, max_tokens)
+        with self._lock:
+            self.calls.append({'prompt': prompt, 'model': model, 'max_tokens': max_tokens,
+                               'temperature': temperature, 'top_p': top_p, 'top_k': top_k})
+        return Completion(text=text, input_tokens=self._count(prompt, model),
+                          output_tokens=self._count(text, model), model=model)
+
+
+class OpenAIModelClient(ModelClient):
+    """Backend for OpenAI-compatible chat completion APIs."""
+
+    def __init__(self, api_key: Optional[str] = None, api_url: str = MODEL_CLIENT['api_url'],
+                 timeout: float = PERFORMANCE['timeout_seconds']):
+        self.api_key = api_key or os.environ.get('API_KEY')
+        if not self.api_key:
+            raise ValueError("API_KEY is not set")
+        self.api_url = api_url
+        self.timeout = timeout
+
+    def complete(self, prompt: str, model: str, max_tokens: int,
+                 temperature: float = MODEL_CLIENT['temperature'],
+                 top_p: float = MODEL_CLIENT['top_p'],
+                 top_k: Optional[int] = MODEL_CLIENT['top_k']) -> Completion:
+        # top_k is not part of the chat completions API and is ignored
+        response = requests.post(
+            self.api_url,
+            headers={'Authorization': f'Bearer {self.api_key}'},
+            json={
+                'model': model,
+                'messages': [{'role': 'user', 'content': prompt}],
+                'max_tokens': max_tokens,
+                'temperature': temperature,
+                'top_p': top_p
+            },
+            timeout=self.timeout
+        )
+        if response.status_code == 429:
+            retry_after = response.headers.get('Retry-After')
+            raise RateLimitError("Rate limit exceeded",
+                                 float(retry_after) if retry_after else None)
+        response.raise_for_status()
+        data = response.json()
+        return Completion(
+            text=data['choices'][0]['message']['content'],
+            input_tokens=data['usage']['prompt_tokens'],
+            output_tokens=data['usage']['completion_tokens'],
+            model=model
+        )
+
+
+def create_client(backend: str = MODEL_CLIENT['backend'], token_mgr=None) -> ModelClient:
+    """Create a model client for the named backend."""
+    if backend == 'local':
+        return LocalModelClient(token_mgr)
+    if backend == 'openai':
+        return OpenAIModelClient()
+    raise ValueError(f"Backend {backend} not supported")
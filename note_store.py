@@ -0,0 +1,400 @@
+"""
+Log-structured note storage for NoteMind.
+
+Notes are appended to segment files and never rewritten in place; updates
+and deletes append a new record. A compact binary index file holds one
+fixed-size entry per record, so adds are O(1) and startup only has to read
+the index, not the segments. Reads slice memory-mapped segments, and
+compaction copies live records out of old segments once enough of them
+is dead.
+"""
+
+import gc
+import glob
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from operator import itemgetter
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from config import STORAGE
+
+# crc32, note id, created, token count (-1 if unknown), text length, flags
+RECORD_HEADER = struct.Struct('<IqdiIB')
+FLAG_DELETED = 1
+
+INDEX_DTYPE = np.dtype([('note_id', '<i8'), ('segment', '<u4'), ('offset', '<u8'),
+                        ('length', '<u4'), ('created', '<f8'), ('token_count', '<i4'),
+                        ('flags', 'u1')])
+
+SEGMENT_PATTERN = re.compile(r'notes-(\d+)\.seg$')
+
+
+@dataclass
+class Note:
+    """A single stored note."""
+    id: int
+    text: str
+    created: float
+    token_count: Optional[int] = None
+
+
+# In-memory index entry: segment, record offset, text length, created, token count
+_Entry = Tuple[int, int, int, float, int]
+
+
+class NoteStore:
+    """Append-only note store with an in-memory offset index."""
+
+    def __init__(self, data_dir: str = STORAGE['data_dir'], token_mgr=None,
+                 model: str = 'gpt-3.5-turbo',
+                 segment_bytes: int = STORAGE['segment_bytes'],
+                 compact_ratio: float = STORAGE['compact_ratio']):
+        self.data_dir = data_dir
+        self.token_mgr = token_mgr
+        self.model = model
+        self.segment_bytes = segment_bytes
+        self.compact_ratio = compact_ratio
+        self.index_path = os.path.join(data_dir, 'notes.idx')
+
+        self.index: Dict[int, _Entry] = {}
+        self.next_id = 1
+        self.active = 1
+        self.segment_sizes: Dict[int, int] = {}
+        self.live_bytes = 0
+        self._maps: Dict[int, mmap.mmap] = {}
+        self._lock = threading.RLock()
+        self._compaction: Optional[threading.Thread] = None
+
+        os.makedirs(data_dir, exist_ok=True)
+        self._load()
+
+    # Loading
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.data_dir, f'notes-{segment:06d}.seg')
+
+    def _load(self):
+        """Rebuild the in-memory index from the index file and the active segment tail."""
+        for path in glob.glob(os.path.join(self.data_dir, 'notes-*.seg')):
+            segment = int(SEGMENT_PATTERN.search(path).group(1))
+            self.segment_sizes[segment] = os.path.getsize(path)
+        if self.segment_sizes:
+            self.active = max(self.segment_sizes)
+
+        indexed_end = 0
+        if os.path.exists(self.index_path):
+            records = np.fromfile(self.index_path, dtype=INDEX_DTYPE)
+            # Drop entries whose record did not make it into its segment
+            ends = records['offset'] + RECORD_HEADER.size + records['length']
+            segments = records['segment'].astype(np.int64)
+            sizes = np.zeros(max([int(segments.max(initial=0))] + list(self.segment_sizes)) + 1,
+                             dtype=np.uint64)
+            for segment, size in self.segment_sizes.items():
+                sizes[segment] = size
+            records = records[(ends <= sizes[segments]) | (records['flags'] & FLAG_DELETED > 0)]
+            self._apply(records)
+            in_active = records['segment'] == self.active
+            if in_active.any():
+                indexed_end = int((records['offset'] + RECORD_HEADER.size +
+                                   records['length'])[in_active].max())
+
+        self._recover_tail(indexed_end)
+        self._remove_orphans()
+
+        self.segment_sizes.setdefault(self.active, 0)
+        self.live_bytes = sum(map(itemgetter(2), self.index.values())) + \
+            RECORD_HEADER.size * len(self.index)
+
+    def _apply(self, records: np.ndarray):
+        """Replay index entries; later entries replace earlier ones."""
+        if not len(records):
+            return
+        # Keep only the last entry of each note
+        ids = records['note_id'][::-1]
+        _, last = np.unique(ids, return_index=True)
+        latest = records[::-1][last]
+        deleted = latest['flags'] & FLAG_DELETED > 0
+        for note_id in latest['note_id'][deleted].tolist():
+            self.index.pop(note_id, None)
+        live = latest[~deleted]
+        # Building millions of tuples triggers needless cyclic GC passes
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self.index.update(zip(live['note_id'].tolist(),
+                                  zip(live['segment'].tolist(), live['offset'].tolist(),
+                                      live['length'].tolist(), live['created'].tolist(),
+                                      live['token_count'].tolist())))
+        finally:
+            if enabled:
+                gc.enable()
+        self.next_id = max(self.next_id, int(records['note_id'].max()) + 1)
+
+    def _recover_tail(self, offset: int):
+        """Index records written to the active segment after the last index entry."""
+        path = self._segment_path(self.active)
+        if not os.path.exists(path) or os.path.getsize(path) <= offset:
+            return
+
+        recovered = []
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+        position = 0
+        while position + RECORD_HEADER.size <= len(data):
+            crc, note_id, created, token_count, length, flags = \
+                RECORD_HEADER.unpack_from(data, position)
+            end = position + RECORD_HEADER.size + length
+            if end > len(data) or zlib.crc32(data[position + 4:end]) != crc:
+                break
+            recovered.append((note_id, self.active, offset + position, length,
+                              created, token_count, flags))
+            position = end
+
+        # Cut off a partially written record
+        with open(path, 'r+b') as f:
+            f.truncate(offset + position)
+        self.segment_sizes[self.active] = offset + position
+
+        if recovered:
+            records = np.array(recovered, dtype=INDEX_DTYPE)
+            self._apply(records)
+            with open(self.index_path, 'ab') as f:
+                f.write(records.tobytes())
+
+    def _remove_orphans(self):
+        """Delete old segments that no live note points into."""
+        used = set(map(itemgetter(0), self.index.values()))
+        for segment in list(self.segment_sizes):
+            if segment != self.active and segment not in used:
+                try:
+                    os.remove(self._segment_path(segment))
+                except OSError:
+                    continue
+                del self.segment_sizes[segment]
+
+    # Writing
+
+    def _append(self, note_id: int, text: str, created: float,
+                token_count: Optional[int], flags: int = 0) -> _Entry:
+        """Append a record to the active segment and its entry to the index file."""
+        body = text.encode('utf-8', 'surrogatepass')
+        stored_count = -1 if token_count is None else token_count
+        header = RECORD_HEADER.pack(0, note_id, created, stored_count, len(body), flags)
+        crc = zlib.crc32(header[4:] + body)
+        record = struct.pack('<I', crc) + header[4:] + body
+
+        if self.segment_sizes.get(self.active, 0) + len(record) > self.segment_bytes and \
+                self.segment_sizes.get(self.active, 0) > 0:
+            self.active += 1
+            self.segment_sizes[self.active] = 0
+
+        offset = self.segment_sizes.get(self.active, 0)
+        with open(self._segment_path(self.active), 'ab') as f:
+            f.write(record)
+        self.segment_sizes[self.active] = offset + len(record)
+
+        entry = (note_id, self.active, offset, len(body), created, stored_count, flags)
+        with open(self.index_path, 'ab') as f:
+            f.write(np.array([entry], dtype=INDEX_DTYPE).tobytes())
+
+        self.next_id = max(self.next_id, note_id + 1)
+        return entry[1:6]
+
+    def _count(self, text: str, token_count: Optional[int]) -> Optional[int]:
+        if token_count is None and self.token_mgr is not None:
+            return self.token_mgr.count_tokens(text, self.model)
+        return token_count
+
+    def add(self, text: str, token_count: Optional[int] = None) -> Note:
+        """Store a new note and return it.
+
+        The token count is cached with the record; it is computed with the
+        store's TokenManager unless given.
+        """
+        token_count = self._count(text, token_count)
+        with self._lock:
+            note_id = self.next_id
+            created = time.time()
+            entry = self._append(note_id, text, created, token_count)
+            self.index[note_id] = entry
+            self.live_bytes += RECORD_HEADER.size + entry[2]
+        return Note(id=note_id, text=text, created=created, token_count=token_count)
+
+    def update(self, note_id: int, text: str, token_count: Optional[int] = None) -> Note:
+        """Replace the text of an existing note."""
+        token_count = self._count(text, token_count)
+        with self._lock:
+            old = self.index.get(note_id)
+            if old is None:
+                raise KeyError(f"Note {note_id} not found")
+            entry = self._append(note_id, text, old[3], token_count)
+            self.index[note_id] = entry
+            self.live_bytes += entry[2] - old[2]
+        self._maybe_compact()
+        return Note(id=note_id, text=text, created=old[3], token_count=token_count)
+
+    def delete(self, note_id: int) -> bool:
+        """Delete a note; returns False if it did not exist."""
+        with self._lock:
+            old = self.index.pop(note_id, None)
+            if old is None:
+                return False
+            self._append(note_id, "", time.time(), None, FLAG_DELETED)
+            self.live_bytes -= RECORD_HEADER.size + old[2]
+        self._maybe_compact()
+        return True
+
+    # Reading
+
+    def _view(self, entry: _Entry) -> memoryview:
+        """Zero-copy view of a record's text bytes."""
+        segment, offset, length = entry[0], entry[1], entry[2]
+        start = offset + RECORD_HEADER.size
+        mapped = self._maps.get(segment)
+        if mapped is None or len(mapped) < start + length:
+            with open(self._segment_path(segment), 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = mapped
+        return memoryview(mapped)[start:start + length]
+
+    def get_bytes(self, note_id: int) -> Optional[memoryview]:
+        """Return the UTF-8 text of a note without copying it.
+
+        The view stays valid until the next compaction.
+        """
+        with self._lock:
+            entry = self.index.get(note_id)
+            return None if entry is None else self._view(entry)
+
+    def get(self, note_id: int) -> Optional[Note]:
+        """Return a note by id, or None if it does not exist."""
+        with self._lock:
+            entry = self.index.get(note_id)
+            if entry is None:
+                return None
+            text = str(self._view(entry), 'utf-8', 'surrogatepass')
+        return Note(id=note_id, text=text, created=entry[3],
+                    token_count=None if entry[4] < 0 else entry[4])
+
+    def token_count(self, note_id: int) -> Optional[int]:
+        """Cached token count of a note, without reading its text."""
+        entry = self.index.get(note_id)
+        if entry is None or entry[4] < 0:
+            return None
+        return entry[4]
+
+    def list_notes(self) -> List[Note]:
+        """Return all notes in id order."""
+        return list(self.iter_notes())
+
+    def iter_notes(self) -> Iterator[Note]:
+        """Yield notes in id order, reading each one only when it is reached."""
+        with self._lock:
+            ids = sorted(self.index)
+        for note_id in ids:
+            note = self.get(note_id)
+            if note is not None:
+                yield note
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, note_id: int) -> bool:
+        return note_id in self.index
+
+    # Compaction
+
+    def dead_ratio(self) -> float:
+        """Fraction of stored bytes that belong to replaced or deleted records."""
+        total = sum(self.segment_sizes.values())
+        return 1 - self.live_bytes / total if total else 0.0
+
+    def _maybe_compact(self):
+        if self.dead_ratio() >= self.compact_ratio:
+            self.compact(background=True)
+
+    def compact(self, background: bool = False) -> Optional[threading.Thread]:
+        """Copy live records out of sealed segments and drop the old ones.
+
+        With background=True the copy runs in a thread, which is returned;
+        reads and writes continue meanwhile.
+        """
+        if background:
+            if self._compaction is not None and self._compaction.is_alive():
+                return self._compaction
+            self._compaction = threading.Thread(target=self._compact, daemon=True)
+            self._compaction.start()
+            return self._compaction
+        self._compact()
+        return None
+
+    def _compact(self):
+        with self._lock:
+            sealed = [s for s in self.segment_sizes if s <= self.active]
+            # Reserve a number for the output below the new active segment, so
+            # a crash before the swap leaves an orphan rather than a live tail
+            target = self.active + 1
+            self.active += 2
+            self.segment_sizes[self.active] = 0
+            live = [(note_id, entry) for note_id, entry in self.index.items()
+                    if entry[0] in sealed]
+
+        moved = {}
+        offset = 0
+        with open(self._segment_path(target), 'wb') as out:
+            for note_id, entry in live:
+                segment, record_offset, length = entry[0], entry[1], entry[2]
+                view = self._view(entry)
+                header_start = record_offset
+                mapped = self._maps[segment]
+                out.write(mapped[header_start:header_start + RECORD_HEADER.size])
+                out.write(view)
+                moved[note_id] = (entry, (target, offset) + entry[2:])
+                offset += RECORD_HEADER.size + length
+            out.flush()
+            os.fsync(out.fileno())
+
+        with self._lock:
+            for note_id, (old, new) in moved.items():
+                # Notes changed during the copy keep their newer record
+                if self.index.get(note_id) == old:
+                    self.index[note_id] = new
+            self.segment_sizes[target] = offset
+
+            entries = [(note_id,) + entry[:5] + (0,) for note_id, entry in self.index.items()]
+            if self.next_id - 1 not in self.index:
+                # Remember the highest id ever used so deleted ids are not reissued
+                entries.append((self.next_id - 1, target, 0, 0, 0.0, -1, FLAG_DELETED))
+            tmp_path = self.index_path + '.tmp'
+            np.array(entries, dtype=INDEX_DTYPE).tofile(tmp_path)
+            os.replace(tmp_path, self.index_path)
+
+            for segment in sealed:
+                mapped = self._maps.pop(segment, None)
+                if mapped is not None:
+                    try:
+                        mapped.close()
+                    except BufferError:
+                        pass
+            self._remove_orphans()
+
+    def close(self):
+        """Wait for compaction and release memory maps."""
+        if self._compaction is not None:
+            self._compaction.join()
+        with self._lock:
+            for mapped in self._maps.values():
+                try:
+                    mapped.close()
+                except BufferError:
+                    pass
+            self._maps.clear()
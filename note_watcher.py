@@ -0,0 +1,279 @@
+"""
+Watch mode for NoteMind.
+
+A polling scanner compares every note file's mtime and size with the last
+sync, so an idle vault costs one directory walk per poll and only files
+whose stat changed are read and hashed. Changes are debounced until a file
+stops changing, then read, encoded and chunked in batches on a thread pool;
+only the store records, stored tokens and index entries of files whose
+content actually changed are rewritten.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import SEARCH, WATCH
+from keyword_index import KeywordIndex
+from token_store import TokenStore
+from vector_index import VectorIndex
+
+# mtime in nanoseconds, size in bytes
+Stat = Tuple[int, int]
+
+
+def scan(root: str, extensions: Tuple[str, ...]) -> Dict[str, Stat]:
+    """Return the stat of every note file under root.
+
+    Hidden files and directories, such as a data directory kept inside
+    the vault, are skipped.
+    """
+    found = {}
+    stack = [root]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.endswith(extensions) and entry.is_file():
+                        st = entry.stat()
+                        found[entry.path] = (st.st_mtime_ns, st.st_size)
+                except OSError:
+                    continue
+    return found
+
+
+@dataclass
+class WatchedFile:
+    """What the last sync recorded about a file."""
+    note_id: int
+    mtime_ns: int
+    size: int
+    digest: str
+
+
+@dataclass
+class SyncReport:
+    """Files handled by one round of processing."""
+    added: List[str] = field(default_factory=list)
+    updated: List[str] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+    unchanged: int = 0           # stat changed but content did not
+    tokens: int = 0              # tokens encoded
+
+    def summary(self) -> Dict:
+        return {
+            'added': len(self.added),
+            'updated': len(self.updated),
+            'deleted': len(self.deleted),
+            'unchanged': self.unchanged,
+            'tokens': self.tokens
+        }
+
+
+@dataclass
+class _Prepared:
+    path: str
+    stat: Optional[Stat] = None  # None if the file is gone or unreadable
+    digest: str = ''
+    text: Optional[str] = None   # None if the content did not change
+    tokens: List[int] = field(default_factory=list)
+    chunks: List[str] = field(default_factory=list)
+    unreadable: bool = False     # read failed for a reason other than deletion
+
+
+class NoteWatcher:
+    """Keeps a note store and its indexes in sync with a directory of files."""
+
+    def __init__(self, root: str, store, token_mgr, model: str = 'gpt-3.5-turbo',
+                 extensions: List[str] = WATCH['extensions'],
+                 debounce: float = WATCH['debounce_seconds'],
+                 batch_size: int = WATCH['batch_size'],
+                 max_workers: int = WATCH['max_workers'],
+                 chunk_tokens: int = SEARCH['chunk_tokens']):
+        if not os.path.isdir(root):
+            raise ValueError(f"{root} is not a directory")
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+
+        self.root = os.path.abspath(root)
+        self.store = store
+        self.token_mgr = token_mgr
+        self.model = model
+        self.extensions = tuple(extensions)
+        self.debounce = debounce
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.chunk_tokens = chunk_tokens
+
+        self.token_store = TokenStore(store.data_dir, token_mgr, model)
+        self.vector_index = VectorIndex(store.data_dir)
+        self.keyword_index = KeywordIndex(store.data_dir)
+        self.state_path = os.path.join(store.data_dir, 'watch.json')
+
+        self.files: Dict[str, WatchedFile] = {}
+        # path -> (stat seen, or None if deleted; when it last changed)
+        self.pending: Dict[str, Tuple[Optional[Stat], float]] = {}
+        self._load_state()
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return
+        with open(self.state_path, 'r', encoding='utf-8') as f:
+            for path, values in json.load(f).items():
+                self.files[path] = WatchedFile(*values)
+
+    def _save_state(self):
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({path: [w.note_id, w.mtime_ns, w.size, w.digest]
+                       for path, w in self.files.items()}, f)
+        os.replace(tmp_path, self.state_path)
+
+    # Change detection
+
+    def poll(self, now: Optional[float] = None) -> int:
+        """Scan the directory and queue files whose stat changed.
+
+        Returns the number of queued files.
+        """
+        now = time.monotonic() if now is None else now
+        current = scan(self.root, self.extensions)
+
+        for path, stat in current.items():
+            known = self.files.get(path)
+            if known is not None and (known.mtime_ns, known.size) == stat:
+                self.pending.pop(path, None)
+                continue
+            queued = self.pending.get(path)
+            if queued is None or queued[0] != stat:
+                self.pending[path] = (stat, now)
+
+        prefix = self.root + os.sep
+        for path in self.files:
+            if path not in current and path.startswith(prefix):
+                queued = self.pending.get(path)
+                if queued is None or queued[0] is not None:
+                    self.pending[path] = (None, now)
+
+        # Files created and removed again before they were processed
+        for path in [p for p in self.pending if p not in current and p not in self.files]:
+            del self.pending[path]
+        return len(self.pending)
+
+    def ready(self, now: Optional[float] = None) -> List[str]:
+        """Queued files that have not changed for the debounce interval."""
+        now = time.monotonic() if now is None else now
+        return sorted(path for path, (_, changed) in self.pending.items()
+                      if now - changed >= self.debounce)
+
+    # Processing
+
+    def _prepare(self, path: str) -> _Prepared:
+        """Read, hash, encode and chunk one file; runs on a worker thread."""
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+                st = os.fstat(f.fileno())
+        except FileNotFoundError:
+            return _Prepared(path)
+        except OSError:
+            # E.g. a permission error or an editor's lock; try again later
+            return _Prepared(path, unreadable=True)
+
+        prepared = _Prepared(path, (st.st_mtime_ns, st.st_size),
+                             hashlib.blake2b(data, digest_size=16).hexdigest())
+        known = self.files.get(path)
+        if known is not None and known.digest == prepared.digest:
+            return prepared
+
+        prepared.text = data.decode('utf-8', 'replace')
+        prepared.tokens = self.token_mgr.encode(prepared.text, self.model)
+        prepared.chunks = self.token_mgr.chunk_text(prepared.text, self.chunk_tokens,
+                                                    self.model, tokens=prepared.tokens)
+        return prepared
+
+    def process(self, paths: List[str]) -> SyncReport:
+        """Bring the given files up to date in batches."""
+        report = SyncReport()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for start in range(0, len(paths), self.batch_size):
+                batch = list(pool.map(self._prepare, paths[start:start + self.batch_size]))
+                self._apply(batch, report)
+        return report
+
+    def _apply(self, batch: List[_Prepared], report: SyncReport):
+        """Write one prepared batch to the store and indexes."""
+        deleted_ids = []
+        replaced_ids = []
+        changed = []
+        for item in batch:
+            if item.unreadable:
+                # Stays pending, so the next round retries it
+                continue
+            self.pending.pop(item.path, None)
+            known = self.files.get(item.path)
+
+            if item.stat is None:
+                if known is not None:
+                    self.store.delete(known.note_id)
+                    deleted_ids.append(known.note_id)
+                    del self.files[item.path]
+                    report.deleted.append(item.path)
+                continue
+
+            if item.text is None:
+                known.mtime_ns, known.size = item.stat
+                report.unchanged += 1
+                continue
+
+            if known is not None and known.note_id in self.store:
+                note = self.store.update(known.note_id, item.text, token_count=len(item.tokens))
+                replaced_ids.append(note.id)
+                report.updated.append(item.path)
+            else:
+                note = self.store.add(item.text, token_count=len(item.tokens))
+                report.added.append(item.path)
+            self.token_store.put(note.id, note.text, item.tokens)
+            self.files[item.path] = WatchedFile(note.id, item.stat[0], item.stat[1], item.digest)
+            changed.append((note.id, item.text, item.chunks))
+            report.tokens += len(item.tokens)
+
+        self.vector_index.remove(deleted_ids + replaced_ids)
+        for note_id, _, chunks in changed:
+            self.vector_index.add(note_id, chunks)
+        # Re-added notes supersede their old postings
+        self.keyword_index.remove(deleted_ids)
+        self.keyword_index.add_many([(note_id, text) for note_id, text, _ in changed])
+        self._save_state()
+
+    def sync(self) -> SyncReport:
+        """Process every change now, without waiting for the debounce interval."""
+        self.poll()
+        return self.process(sorted(self.pending))
+
+    def run(self, interval: float = WATCH['poll_interval'],
+            stop: Optional[threading.Event] = None,
+            on_report: Optional[Callable[[SyncReport], None]] = None):
+        """Poll until stop is set, processing debounced changes as they settle."""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            self.poll()
+            paths = self.ready()
+            if paths:
+                report = self.process(paths)
+                if on_report is not None:
+                    on_report(report)
+            stop.wait(interval)
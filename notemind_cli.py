@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+NoteMind command-line interface for storing and searching notes.
+"""
+
+import argparse
+import os
+import sys
+from config import (STORAGE, SEARCH, KEYWORD, SUMMARY, MODEL_CLIENT, WATCH, RESPONSE_CACHE,
+                    EXPORT)
+from exporter import export
+from keyword_index import KeywordIndex
+from model_client import create_client
+from note_store import NoteStore
+from note_watcher import NoteWatcher
+from response_cache import CachedClient, ResponseCache
+from scheduler import RequestScheduler, ScheduledClient
+from summarizer import Summarizer
+from token_manager import TokenManager
+from token_store import TokenStore
+from token_cli import output_result
+from vector_index import VectorIndex
+
+
+def index_note(token_mgr, index, note, model, tokens=None):
+    """Chunk a note and add its chunks to the vector index."""
+    chunks = token_mgr.chunk_text(note.text, SEARCH['chunk_tokens'], model, tokens=tokens)
+    index.add(note.id, chunks)
+    return chunks
+
+
+def cmd_add(args, token_mgr, store):
+    """Store a note and index it for search."""
+    text = args.text
+    if args.file:
+        with open(args.file, 'r', encoding='utf-8') as f:
+            text = f.read()
+    if not text:
+        print("Please provide note text or --file")
+        sys.exit(1)
+
+    # Encode once; the count is cached with the note and chunking uses the tokens
+    tokens = token_mgr.encode(text, args.model)
+    note = store.add(text, token_count=len(tokens))
+    tokens = TokenStore(store.data_dir, token_mgr, args.model).put(note.id, note.text, tokens)
+    chunks = index_note(token_mgr, VectorIndex(store.data_dir), note, args.model, tokens)
+    KeywordIndex(store.data_dir).add(note.id, note.text)
+    output_result({
+        'id': note.id,
+        'tokens': len(tokens),
+        'chunks': len(chunks)
+    }, args.output)
+
+
+def cmd_search(args, token_mgr, store):
+    """Search stored notes by meaning or by keywords."""
+    keywords = KeywordIndex(store.data_dir)
+    if args.mode == 'keyword':
+        hits = keywords.search(args.query, args.top_k)
+    else:
+        hits = VectorIndex(store.data_dir).search(args.query, args.top_k)
+
+    results = []
+    for hit in hits:
+        note = store.get(hit.note_id)
+        if note is None:
+            continue
+        result = {'id': hit.note_id, 'score': round(hit.score, 4)}
+        if args.mode == 'semantic':
+            result['chunk'] = hit.chunk_index
+        result['text'] = keywords.snippet(token_mgr, note.text, args.query,
+                                          args.snippet_tokens, args.model)
+        results.append(result)
+    output_result({'query': args.query, 'results': results}, args.output)
+
+
+def create_summarizer(args, token_mgr, store):
+    """Build a summarizer whose model calls go through the response cache.
+
+    The response cache is the only cache kept across runs, so its TTL and
+    eviction apply to every summary call.
+    """
+    client = create_client(args.backend, token_mgr)
+    if args.backend != 'local':
+        # Keep remote calls under the provider's request and token limits
+        client = ScheduledClient(RequestScheduler(token_mgr, client))
+    cache = ResponseCache(token_mgr, os.path.join(store.data_dir, 'responses.json'),
+                          near_duplicates=args.near_duplicates)
+    client = CachedClient(client, cache)
+
+    return Summarizer(
+        token_mgr,
+        client,
+        model=args.model,
+        summary_tokens=args.summary_tokens,
+        max_cost=args.max_cost
+    )
+
+
+def cmd_summarize(args, token_mgr, store):
+    """Summarize one note or every stored note."""
+    if args.id is not None:
+        note = store.get(args.id)
+        if note is None:
+            print(f"Note {args.id} not found")
+            sys.exit(1)
+        notes = [note]
+    else:
+        notes = store.iter_notes()
+
+    summarizer = create_summarizer(args, token_mgr, store)
+    client = summarizer.client
+    cache = client.cache
+
+    summaries = []
+    try:
+        for note in notes:
+            result = summarizer.summarize(note.text)
+            summaries.append({
+                'id': note.id,
+                'summary': result.summary,
+                'chunks': result.chunk_count,
+                'cache_hits': result.cache_hits,
+                'cost': round(result.total_cost, 6)
+            })
+    finally:
+        client.close()
+    output_result({
+        'summaries': summaries,
+        'model': args.model,
+        'responses_cached': cache.stats['hits'],
+        'cost_saved': round(cache.stats['cost_saved'], 6)
+    }, args.output)
+
+
+def note_records(store, summarizer=None):
+    """Yield export records for stored notes, reading one note at a time."""
+    for note in store.iter_notes():
+        record = {'id': note.id, 'created': note.created, 'tokens': note.token_count}
+        if summarizer is not None:
+            record['summary'] = summarizer.summarize(note.text).summary
+        record['text'] = note.text
+        yield record
+
+
+def cmd_export(args, token_mgr, store):
+    """Stream stored notes, optionally with summaries, to a file or stdout."""
+    summarizer = create_summarizer(args, token_mgr, store) if args.summaries else None
+    try:
+        export(note_records(store, summarizer), args.out, args.format,
+               title='NoteMind notes', label='Note')
+    finally:
+        if summarizer is not None:
+            summarizer.client.close()
+
+
+def cmd_watch(args, token_mgr, store):
+    """Keep the store in sync with a directory of note files."""
+    watcher = NoteWatcher(
+        args.directory,
+        store,
+        token_mgr,
+        model=args.model,
+        debounce=args.debounce,
+        max_workers=args.workers
+    )
+    report = watcher.sync()
+    output_result(report.summary(), args.output)
+    if args.once:
+        return
+
+    try:
+        watcher.run(args.interval,
+                    on_report=lambda report: output_result(report.summary(), args.output))
+    except KeyboardInterrupt:
+        pass
+
+
+def add_summary_arguments(parser):
+    """Options shared by commands that summarize notes."""
+    parser.add_argument('--backend', choices=['local', 'openai'],
+                        default=MODEL_CLIENT['backend'], help='Model backend')
+    parser.add_argument('--summary-tokens', type=int, default=SUMMARY['summary_tokens'],
+                        help='Output tokens per summary call')
+    parser.add_argument('--max-cost', type=float, default=SUMMARY['max_cost'],
+                        help='Abort before a note would cost more than this')
+    parser.add_argument('--near-duplicates', action='store_true',
+                        default=RESPONSE_CACHE['near_duplicates'],
+                        help='Reuse responses to almost identical prompts')
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='nm', description='NoteMind CLI')
+    parser.add_argument('--data-dir', default=STORAGE['data_dir'],
+                        help='Directory where notes and indexes are stored')
+    parser.add_argument('--model', '-m', default='gpt-3.5-turbo',
+                        help='AI model to use for token counting')
+    parser.add_argument('--output', '-o', choices=['text', 'json'], default='text',
+                        help='Output format')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    add_parser = subparsers.add_parser('add', help='Add a new note')
+    add_parser.add_argument('text', nargs='?', help='Note text')
+    add_parser.add_argument('--file', '-f', help='Read the note from a file')
+    add_parser.set_defaults(handler=cmd_add)
+
+    search_parser = subparsers.add_parser('search', help='Search notes using embeddings')
+    search_parser.add_argument('query', help='Search query')
+    search_parser.add_argument('--top-k', '-k', type=int, default=SEARCH['top_k'],
+                               help='Number of results to return')
+    search_parser.add_argument('--mode', choices=['semantic', 'keyword'], default='semantic',
+                               help='Rank by embeddings or by BM25 keyword score')
+    search_parser.add_argument('--snippet-tokens', type=int, default=KEYWORD['snippet_tokens'],
+                               help='Token budget for each result snippet')
+    search_parser.set_defaults(handler=cmd_search)
+
+    summarize_parser = subparsers.add_parser('summarize', help='Summarize stored notes')
+    summarize_parser.add_argument('id', type=int, nargs='?', help='Only summarize this note')
+    add_summary_arguments(summarize_parser)
+    summarize_parser.set_defaults(handler=cmd_summarize)
+
+    export_parser = subparsers.add_parser('export', help='Export notes/summaries to JSON or Markdown')
+    export_parser.add_argument('--format', '-F', choices=['json', 'jsonl', 'markdown'],
+                               default=EXPORT['format'], help='Export format')
+    export_parser.add_argument('--out', help='Write to this file instead of stdout')
+    export_parser.add_argument('--summaries', action='store_true',
+                               help='Include a summary of each note')
+    add_summary_arguments(export_parser)
+    export_parser.set_defaults(handler=cmd_export)
+
+    watch_parser = subparsers.add_parser('watch', help='Sync notes from a directory as files change')
+    watch_parser.add_argument('directory', help='Directory of note files')
+    watch_parser.add_argument('--once', action='store_true',
+                              help='Sync changed files once and exit')
+    watch_parser.add_argument('--interval', type=float, default=WATCH['poll_interval'],
+                              help='Seconds between directory scans')
+    watch_parser.add_argument('--debounce', type=float, default=WATCH['debounce_seconds'],
+                              help='Seconds a file must stay unchanged before it is processed')
+    watch_parser.add_argument('--workers', type=int, default=WATCH['max_workers'],
+                              help='Threads reading and encoding changed files')
+    watch_parser.set_defaults(handler=cmd_watch)
+
+    args = parser.parse_args()
+
+    try:
+        token_mgr = TokenManager()
+        store = NoteStore(args.data_dir)
+    except Exception as e:
+        print(f"Error initializing NoteMind: {e}")
+        sys.exit(1)
+
+    try:
+        args.handler(args, token_mgr, store)
+    except Exception as e:
+        print(f"Error performing command: {e}")
+        sys.exit(1)
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Parallel encoding of large documents across processes.
+
+Pickling multi-megabyte texts to every worker costs more than encoding
+them, so documents are copied once into a shared memory block and workers
+only receive (offset, length) descriptors into it. Each worker loads its
+encoder once at startup and sends token IDs back as uint32 arrays, or just
+counts. Large documents are split into one piece per worker (within
+min_piece_bytes and piece_bytes) where a newline is followed by a
+non-space character, a pre-tokenizer boundary for the tiktoken encodings,
+so one book-sized note is encoded on every core and its pieces join to
+the tokens of the whole.
+"""
+
+import multiprocessing
+import os
+import re
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+import tiktoken
+
+from config import PARALLEL
+from token_manager import ENCODINGS
+
+SAFE_CUT = re.compile(rb"\n(?=[^\s\x80-\xff])")
+
+# Shared block name, byte offset, byte length
+Piece = Tuple[str, int, int]
+
+# Worker process state
+_encoder = None
+_blocks = {}
+
+
+def _init_worker(encoding: str):
+    """Load the encoder once per worker process."""
+    global _encoder
+    _encoder = tiktoken.get_encoding(encoding)
+
+
+def _text(piece: Piece) -> str:
+    name, offset, length = piece
+    block = _blocks.get(name)
+    if block is None:
+        # Each call uses a new block; let go of the previous one
+        for old in _blocks.values():
+            old.close()
+        _blocks.clear()
+        block = _blocks[name] = _attach(name)
+    return str(block.buf[offset:offset + length], 'utf-8', 'surrogatepass')
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    try:
+        # The parent owns and unlinks the block (Python 3.13+)
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def _encode_piece(piece: Piece) -> np.ndarray:
+    return np.array(_encoder.encode(_text(piece)), dtype=np.uint32)
+
+
+def _count_piece(piece: Piece) -> int:
+    return len(_encoder.encode(_text(piece)))
+
+
+def split_pieces(data: bytes, piece_bytes: int) -> List[Tuple[int, int]]:
+    """Split UTF-8 bytes into (offset, length) pieces at safe boundaries.
+
+    A piece only ends early if no safe cut follows it, so pieces are at
+    least piece_bytes long except for the last one.
+    """
+    pieces = []
+    start = 0
+    while len(data) - start > piece_bytes:
+        match = SAFE_CUT.search(data, start + piece_bytes)
+        if match is None:
+            break
+        cut = match.start() + 1
+        pieces.append((start, cut - start))
+        start = cut
+    pieces.append((start, len(data) - start))
+    return pieces
+
+
+class ParallelEncoder:
+    """Process pool that encodes documents passed through shared memory."""
+
+    def __init__(self, token_mgr, model: str = 'gpt-3.5-turbo',
+                 processes: Optional[int] = PARALLEL['processes'],
+                 piece_bytes: int = PARALLEL['piece_bytes'],
+                 min_piece_bytes: int = PARALLEL['min_piece_bytes'],
+                 start_method: Optional[str] = PARALLEL['start_method']):
+        if model not in token_mgr.encoders or model not in ENCODINGS:
+            raise ValueError(f"Model {model} not supported")
+        if not 0 < min_piece_bytes <= piece_bytes:
+            raise ValueError("piece sizes must satisfy 0 < min_piece_bytes <= piece_bytes")
+
+        self.token_mgr = token_mgr
+        self.model = model
+        self.piece_bytes = piece_bytes
+        self.min_piece_bytes = min_piece_bytes
+        self.processes = processes or os.cpu_count() or 1
+        context = multiprocessing.get_context(start_method)
+        if os.name == 'posix':
+            # Workers must share the parent's resource tracker, or each would
+            # report the blocks it attached to as leaked when it exits; there
+            # is no tracker on Windows
+            resource_tracker.ensure_running()
+        self._pool = context.Pool(self.processes, initializer=_init_worker,
+                                  initargs=(ENCODINGS[model],))
+
+    def _run(self, texts: List[str], task: Callable) -> List[List]:
+        """Run task over the pieces of every text; returns results per text."""
+        data = [text.encode('utf-8', 'surrogatepass') for text in texts]
+        block = shared_memory.SharedMemory(create=True, size=max(1, sum(map(len, data))))
+        try:
+            pieces: List[Piece] = []
+            owners = []
+            position = 0
+            for i, document in enumerate(data):
+                block.buf[position:position + len(document)] = document
+                # Give every worker a share of a large document
+                share = -(-len(document) // self.processes)
+                size = max(self.min_piece_bytes, min(self.piece_bytes, share))
+                for offset, length in split_pieces(document, size):
+                    pieces.append((block.name, position + offset, length))
+                    owners.append(i)
+                position += len(document)
+
+            chunksize = max(1, len(pieces) // (self.processes * 4))
+            results = self._pool.map(task, pieces, chunksize=chunksize)
+        finally:
+            block.close()
+            block.unlink()
+
+        grouped: List[List] = [[] for _ in texts]
+        for owner, result in zip(owners, results):
+            grouped[owner].append(result)
+        return grouped
+
+    def encode_many(self, texts: List[str]) -> List[np.ndarray]:
+        """Encode documents into uint32 token arrays."""
+        return [np.concatenate(parts) for parts in self._run(texts, _encode_piece)]
+
+    def count_many(self, texts: List[str]) -> List[int]:
+        """Count tokens of documents; workers only send counts back."""
+        return [sum(parts) for parts in self._run(texts, _count_piece)]
+
+    def encode(self, text: str) -> np.ndarray:
+        """Encode one document, split across all workers if it is large."""
+        return self.encode_many([text])[0]
+
+    def count_tokens(self, text: str) -> int:
+        """Count tokens of one document, split across all workers if it is large."""
+        return self.count_many([text])[0]
+
+    def chunk_text(self, text: str, max_tokens: int) -> List[str]:
+        """Chunk a document from tokens encoded in parallel."""
+        return self.token_mgr.chunk_tokens(self.encode(text), max_tokens, self.model)
+
+    def close(self):
+        """Stop the worker processes."""
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,232 @@
+"""
+Token-saving prompt rewrites tried before truncation.
+
+Each step rewrites the prompt without dropping content: whitespace and
+indentation are normalised, repeated paragraphs and lines are removed,
+markdown decoration is collapsed and long URLs and IDs are replaced by
+short placeholders that can be expanded again. Steps are measured with
+the segment-deduplicated counter, so after a rewrite only the segments it
+touched are re-encoded, and a step is kept only if it saves tokens.
+"""
+
+import re
+import textwrap
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import COMPACTION
+
+FENCE = re.compile(r"^\s*(```|~~~)")
+INNER_SPACE = re.compile(r"(?<=\S)[ \t]{2,}")
+BLANK_RUN = re.compile(r"\n{3,}")
+RULE = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+# Delimiters inside a word (a**2, snake__case) are not emphasis
+EMPHASIS = re.compile(r"(?<![\w*])(\*\*|__)(?=\S)(.+?)(?<=\S)\1(?![\w*])")
+IDENTIFIER = re.compile(r"\w+")
+HEADING_TAIL = re.compile(r"^(#{1,6} .*?)\s+#+\s*$")
+TABLE_RULE = re.compile(r"^\s*\|?(\s*:?-+:?\s*\|)+\s*:?-*:?\s*$")
+HTML_COMMENT = re.compile(r"<!--.*?-->", re.DOTALL)
+INLINE_CODE = re.compile(r"(`[^`\n]*`)")
+URL = re.compile(r"https?://[^\s<>()\[\]\"']+")
+LONG_ID = re.compile(r"\b(?:[0-9a-fA-F]{8}-(?:[0-9a-fA-F]{4}-){3}[0-9a-fA-F]{12}|"
+                     r"[0-9a-fA-F]{24,}|[A-Za-z0-9_-]*\d[A-Za-z0-9_-]{23,})\b")
+
+
+@dataclass
+class CompactionResult:
+    """A compacted prompt, what each step saved and how to undo placeholders."""
+    text: str
+    original_tokens: int
+    token_count: int
+    steps: List[Tuple[str, int]] = field(default_factory=list)
+    replacements: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.original_tokens - self.token_count
+
+    def expand(self, text: str) -> str:
+        """Put the original URLs and IDs back into text, e.g. a model response."""
+        for placeholder in sorted(self.replacements, key=len, reverse=True):
+            text = text.replace(placeholder, self.replacements[placeholder])
+        return text
+
+
+def _outside_fences(text: str, rewrite: Callable[[List[str]], List[str]]) -> str:
+    """Apply a rewrite to the runs of lines outside fenced code blocks.
+
+    Runs of blank lines left behind by the rewrite are collapsed to one.
+    """
+    def flush(run: List[str]) -> List[str]:
+        if not run:
+            return run
+        return BLANK_RUN.sub('\n\n', '\n'.join(rewrite(run))).split('\n')
+
+    lines = text.split('\n')
+    out: List[str] = []
+    run: List[str] = []
+    in_fence = False
+    for line in lines:
+        if FENCE.match(line):
+            if not in_fence:
+                out.extend(flush(run))
+                run = []
+            out.append(line)
+            in_fence = not in_fence
+        elif in_fence:
+            out.append(line)
+        else:
+            run.append(line)
+    out.extend(flush(run) if not in_fence else run)
+    return '\n'.join(out)
+
+
+def normalize_whitespace(text: str) -> str:
+    """Strip trailing spaces, collapse inner runs, blank lines and common indentation."""
+    def rewrite(lines: List[str]) -> List[str]:
+        block = textwrap.dedent('\n'.join(line.rstrip().expandtabs(4) for line in lines))
+        return [INNER_SPACE.sub(' ', line) for line in block.split('\n')]
+
+    text = _outside_fences(text, rewrite)
+    return '\n'.join(line.rstrip() for line in text.split('\n')).strip('\n')
+
+
+def remove_repeats(text: str, min_line_chars: int = COMPACTION['min_line_chars']) -> str:
+    """Drop paragraphs and long lines that already appeared earlier."""
+    seen_paragraphs = set()
+    seen_lines = set()
+
+    def rewrite(lines: List[str]) -> List[str]:
+        out: List[str] = []
+        paragraph: List[str] = []
+        for line in lines + ['']:
+            if line.strip():
+                paragraph.append(line)
+                continue
+            key = '\n'.join(part.strip() for part in paragraph)
+            if paragraph and key in seen_paragraphs:
+                paragraph = []
+                continue
+            seen_paragraphs.add(key)
+            for part in paragraph:
+                stripped = part.strip()
+                if len(stripped) >= min_line_chars:
+                    if stripped in seen_lines:
+                        continue
+                    seen_lines.add(stripped)
+                out.append(part)
+            paragraph = []
+            out.append(line)
+        return out[:-1]
+
+    return _outside_fences(text, rewrite)
+
+
+def _unemphasize(match: re.Match) -> str:
+    # __init__ and other dunder names are code, not bold text
+    if match.group(1) == '__' and IDENTIFIER.fullmatch(match.group(2)):
+        return match.group(0)
+    return match.group(2)
+
+
+def _strip_emphasis(line: str) -> str:
+    # Inline code spans are kept verbatim
+    parts = INLINE_CODE.split(line)
+    parts[::2] = [EMPHASIS.sub(_unemphasize, part) for part in parts[::2]]
+    return ''.join(parts)
+
+
+def collapse_markdown(text: str) -> str:
+    """Remove decoration that carries no content: rules, emphasis, comments."""
+    def rewrite(lines: List[str]) -> List[str]:
+        out = []
+        for line in HTML_COMMENT.sub('', '\n'.join(lines)).split('\n'):
+            if RULE.match(line):
+                continue
+            if TABLE_RULE.match(line) and '-' in line:
+                cells = line.strip().strip('|').count('|') + 1
+                line = '|' + '|'.join('-' * cells) + '|'
+            line = HEADING_TAIL.sub(r'\1', line)
+            out.append(_strip_emphasis(line))
+        return out
+
+    return _outside_fences(text, rewrite)
+
+
+class PromptCompactor:
+    """Applies token-saving rewrites to a prompt until it fits a budget."""
+
+    def __init__(self, token_mgr, model: str = 'gpt-3.5-turbo',
+                 steps: Optional[List[str]] = None,
+                 min_line_chars: int = COMPACTION['min_line_chars'],
+                 min_reference_chars: int = COMPACTION['min_reference_chars']):
+        if model not in token_mgr.encoders:
+            raise ValueError(f"Model {model} not supported")
+
+        self.token_mgr = token_mgr
+        self.model = model
+        self.min_line_chars = min_line_chars
+        self.min_reference_chars = min_reference_chars
+        self.available: Dict[str, Callable[[str, Dict[str, str]], str]] = {
+            'whitespace': lambda text, _: normalize_whitespace(text),
+            'repeats': lambda text, _: remove_repeats(text, self.min_line_chars),
+            'markdown': lambda text, _: collapse_markdown(text),
+            'references': self.shorten_references
+        }
+        self.steps = list(COMPACTION['steps'] if steps is None else steps)
+        for name in self.steps:
+            if name not in self.available:
+                raise ValueError(f"Unknown compaction step: {name}")
+
+    def count(self, text: str) -> int:
+        """Exact count that only re-encodes segments changed since the last call."""
+        return self.token_mgr.count_tokens(text, self.model, dedup=True)
+
+    def compact(self, prompt: str, target_tokens: Optional[int] = None) -> CompactionResult:
+        """Apply steps in order, stopping once the prompt fits target_tokens."""
+        count = self.count(prompt)
+        result = CompactionResult(text=prompt, original_tokens=count, token_count=count)
+
+        for name in self.steps:
+            if target_tokens is not None and result.token_count <= target_tokens:
+                break
+            replacements: Dict[str, str] = {}
+            text = self.available[name](result.text, replacements)
+            if text == result.text:
+                continue
+            count = self.count(text)
+            if count >= result.token_count:
+                continue
+            result.steps.append((name, result.token_count - count))
+            result.text = text
+            result.token_count = count
+            result.replacements.update(replacements)
+        return result
+
+    def shorten_references(self, text: str, replacements: Dict[str, str]) -> str:
+        """Replace long URLs and IDs with placeholders, recording them in replacements."""
+        count = self.token_mgr.count_tokens
+        found: Dict[str, str] = {}
+        for pattern, prefix in ((URL, 'URL'), (LONG_ID, 'ID')):
+            for match in pattern.finditer(text):
+                value = match.group(0)
+                if len(value) >= self.min_reference_chars:
+                    found.setdefault(value, prefix)
+
+        numbers = {'URL': 0, 'ID': 0}
+        # Longest first, so a reference is never cut inside a longer one
+        for value in sorted(found, key=len, reverse=True):
+            if value not in text:
+                continue
+            prefix = found[value]
+            numbers[prefix] += 1
+            placeholder = f"[{prefix}{numbers[prefix]}]"
+            while placeholder in text:
+                numbers[prefix] += 1
+                placeholder = f"[{prefix}{numbers[prefix]}]"
+            # Only shorten references where the placeholder is cheaper
+            if count(' ' + placeholder, self.model) >= count(' ' + value, self.model):
+                continue
+            text = text.replace(value, placeholder)
+            replacements[placeholder] = value
+        return text
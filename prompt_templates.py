@@ -0,0 +1,169 @@
+"""
+Precompiled prompt templates with pre-counted static text.
+
+A template such as "Summarize:\\n{note}\\nKeep it short." is compiled once:
+the static text between slots is encoded at compile time, so rendering
+only encodes the slot values plus the few characters of static text that
+touch them. Slot values are truncated to their token budgets.
+"""
+
+import re
+from dataclasses import dataclass, field
+from string import Formatter
+from typing import Dict, List, Optional, Union
+
+# A newline followed by a non-space character is a pre-tokenizer boundary,
+# so static text can be split there and counted in parts.
+SAFE_CUT = re.compile(r"\n(?=\S)")
+
+
+@dataclass
+class Slot:
+    """A variable part of a template."""
+    name: str
+    budget: int = 0
+
+
+@dataclass
+class RenderedPrompt:
+    """A rendered template and its exact token count."""
+    text: str
+    token_count: int
+    truncated: Dict[str, int] = field(default_factory=dict)
+
+
+class PromptTemplate:
+    """A template whose static text has been encoded ahead of time."""
+
+    def __init__(self, token_mgr, template: str, model: str = 'gpt-3.5-turbo',
+                 max_tokens: Optional[int] = None, budgets: Optional[Dict[str, int]] = None):
+        model_info = token_mgr.get_model_info(model)
+        if not model_info:
+            raise ValueError(f"Model {model} not supported")
+
+        self.token_mgr = token_mgr
+        self.template = template
+        self.model = model
+        self.max_tokens = max_tokens if max_tokens is not None else model_info['context_window']
+
+        parts = self._parse(template)
+        self.parts = parts
+        self.slots: Dict[str, Slot] = {}
+        for part in parts:
+            if isinstance(part, Slot):
+                self.slots.setdefault(part.name, part)
+
+        # Units alternate between pre-counted static text and dynamic runs;
+        # a dynamic run is encoded at render time with the slot values filled in.
+        self.static_tokens = 0
+        self.units: List[List[Union[str, Slot]]] = []
+        self._compile(parts)
+        self._assign_budgets(budgets or {})
+
+    @staticmethod
+    def _parse(template: str) -> List[Union[str, Slot]]:
+        """Split a template into static strings and slots."""
+        parts: List[Union[str, Slot]] = []
+        for literal, name, spec, conversion in Formatter().parse(template):
+            if literal:
+                parts.append(literal)
+            if name is None:
+                continue
+            if not name.isidentifier() or spec or conversion:
+                raise ValueError(f"Unsupported template field: {{{name}}}")
+            parts.append(Slot(name))
+        return parts
+
+    def _compile(self, parts: List[Union[str, Slot]]):
+        """Pre-count static text and group the rest into dynamic units."""
+        count = self.token_mgr.count_tokens
+        current: List[Union[str, Slot]] = []
+
+        for i, part in enumerate(parts):
+            if isinstance(part, Slot):
+                current.append(part)
+                continue
+
+            slot_before = i > 0
+            slot_after = i + 1 < len(parts)
+            cuts = [match.end() for match in SAFE_CUT.finditer(part)]
+            left = (cuts[0] if cuts else None) if slot_before else 0
+            right = (cuts[-1] if cuts else None) if slot_after else len(part)
+
+            if left is None or right is None:
+                current.append(part)
+                continue
+
+            head, core, tail = part[:left], part[left:right], part[right:]
+            core_tokens = count(core, self.model) if core else 0
+            # Only trust the cuts if this encoder does not merge across them
+            if count(part, self.model) != count(head, self.model) + core_tokens + count(tail, self.model):
+                current.append(part)
+                continue
+
+            if head:
+                current.append(head)
+            if current:
+                self.units.append(current)
+            self.static_tokens += core_tokens
+            current = [tail] if tail else []
+
+        if current:
+            self.units.append(current)
+
+    def _assign_budgets(self, budgets: Dict[str, int]):
+        """Give explicit budgets and share the remaining tokens among other slots."""
+        unknown = set(budgets) - set(self.slots)
+        if unknown:
+            raise ValueError(f"Budgets given for unknown slots: {sorted(unknown)}")
+
+        edge_tokens = sum(self.token_mgr.count_tokens(part, self.model)
+                          for unit in self.units for part in unit if isinstance(part, str))
+        remaining = self.max_tokens - self.static_tokens - edge_tokens - sum(budgets.values())
+        open_slots = [name for name in self.slots if name not in budgets]
+        if remaining < 0 or (open_slots and remaining < len(open_slots)):
+            raise ValueError(f"Template needs more than {self.max_tokens} tokens")
+
+        for name, slot in self.slots.items():
+            slot.budget = budgets[name] if name in budgets else remaining // len(open_slots)
+
+    def render(self, **values: str) -> RenderedPrompt:
+        """Fill in the slots, truncating values that exceed their budgets."""
+        missing = set(self.slots) - set(values)
+        if missing:
+            raise ValueError(f"Missing values for slots: {sorted(missing)}")
+
+        truncated = {}
+        filled = {}
+        for name, slot in self.slots.items():
+            value = values[name]
+            # A token covers at least one byte, so values this short fit as they are
+            if len(value.encode('utf-8')) > slot.budget:
+                value, removed = self._truncate(value, slot.budget)
+                if removed:
+                    truncated[name] = removed
+            filled[name] = value
+
+        token_count = self.static_tokens
+        for unit in self.units:
+            text = "".join(filled[part.name] if isinstance(part, Slot) else part for part in unit)
+            token_count += self.token_mgr.count_tokens(text, self.model)
+
+        text = "".join(filled[part.name] if isinstance(part, Slot) else part for part in self.parts)
+        return RenderedPrompt(text=text, token_count=token_count, truncated=truncated)
+
+    def _truncate(self, value: str, budget: int):
+        """Cut a value to at most budget tokens; return it and the tokens removed."""
+        encoder = self.token_mgr.encoders[self.model]
+        tokens = encoder.encode(value)
+        if len(tokens) <= budget:
+            return value, 0
+
+        keep = budget
+        text = encoder.decode(tokens[:keep])
+        # Back off if the cut splits a multi-byte character or the decoded
+        # text re-encodes to more tokens than the budget
+        while keep > 0 and (text.endswith('\ufffd') or len(encoder.encode(text)) > budget):
+            keep -= 1
+            text = encoder.decode(tokens[:keep])
+        return text, len(tokens) - keep
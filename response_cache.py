@@ -0,0 +1,355 @@
+"""
+Response cache in front of the model clients.
+
+Responses are keyed by a hash of the normalized prompt, the model and the
+sampling parameters, so repeating a call for an unchanged note never
+reaches the provider. Optionally, prompts that differ only slightly from a
+cached one are matched through MinHash signatures over shingles of their
+tokens, bucketed with locality-sensitive hashing. Entries expire after a
+TTL. When the cache is full, the least recently used entries are weighed
+against each other and the one saving the fewest tokens per byte it takes
+up is evicted.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from config import MODEL_CLIENT, RESPONSE_CACHE
+from model_client import Completion, ModelClient
+
+# Smallest prime above 2**32; MinHash values are taken modulo it
+MINHASH_PRIME = 4294967311
+INNER_SPACE = re.compile(r"[ \t]+")
+
+
+@dataclass
+class CacheEntry:
+    """A cached response."""
+    key: str
+    scope: str
+    text: str
+    model: str
+    input_tokens: int
+    output_tokens: int
+    created: float
+    signature: Optional[np.ndarray] = None
+
+    @property
+    def size(self) -> int:
+        return len(self.text.encode('utf-8', 'surrogatepass')) + len(self.key)
+
+
+@dataclass
+class CacheHit:
+    """A response served from the cache and what it saved."""
+    completion: Completion
+    similarity: float
+    tokens_saved: int
+    cost_saved: float
+
+
+class ResponseCache:
+    """Exact and near-duplicate cache of model responses."""
+
+    def __init__(self, token_mgr, path: Optional[str] = None,
+                 max_entries: int = RESPONSE_CACHE['max_entries'],
+                 max_bytes: int = RESPONSE_CACHE['max_bytes'],
+                 ttl: Optional[float] = RESPONSE_CACHE['ttl_seconds'],
+                 near_duplicates: bool = RESPONSE_CACHE['near_duplicates'],
+                 similarity: float = RESPONSE_CACHE['similarity'],
+                 num_perm: int = RESPONSE_CACHE['num_perm'],
+                 bands: int = RESPONSE_CACHE['bands'],
+                 shingle_tokens: int = RESPONSE_CACHE['shingle_tokens'],
+                 eviction_sample: int = RESPONSE_CACHE['eviction_sample'],
+                 clock: Callable[[], float] = time.time):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+
+        self.token_mgr = token_mgr
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.near_duplicates = near_duplicates
+        self.similarity = similarity
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_tokens = shingle_tokens
+        self.eviction_sample = eviction_sample
+        self.clock = clock
+
+        rng = np.random.default_rng(0x5EED)
+        self._a = rng.integers(1, 2 ** 31, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 2 ** 32, num_perm, dtype=np.uint64)
+
+        self.entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.buckets: Dict[Tuple[str, int, bytes], Set[str]] = {}
+        self.total_bytes = 0
+        self.stats = {'hits': 0, 'near_hits': 0, 'misses': 0, 'evictions': 0,
+                      'expired': 0, 'tokens_saved': 0, 'cost_saved': 0.0}
+        self._lock = threading.RLock()
+        self._load()
+
+    # Keys and signatures
+
+    @staticmethod
+    def normalize(prompt: str) -> str:
+        """Collapse whitespace differences that do not change a prompt's meaning."""
+        lines = prompt.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+        return '\n'.join(INNER_SPACE.sub(' ', line).strip() for line in lines).strip()
+
+    @staticmethod
+    def scope(model: str, max_tokens: int, temperature: float, top_p: float,
+              top_k: Optional[int]) -> str:
+        """Everything besides the prompt that determines a response."""
+        return json.dumps([model, max_tokens, temperature, top_p, top_k])
+
+    @staticmethod
+    def key(normalized: str, scope: str) -> str:
+        data = f"{scope}\0{normalized}".encode('utf-8', 'surrogatepass')
+        return hashlib.sha256(data).hexdigest()
+
+    def signature(self, normalized: str, model: str) -> Optional[np.ndarray]:
+        """MinHash signature over token shingles, or None for an empty prompt."""
+        tokens = np.asarray(self.token_mgr.encode(normalized, model), dtype=np.uint64)
+        if not len(tokens):
+            return None
+        n = min(self.shingle_tokens, len(tokens))
+        shingles = np.zeros(len(tokens) - n + 1, dtype=np.uint64)
+        for i in range(n):
+            shingles = (shingles * np.uint64(1000003) + tokens[i:len(tokens) - n + 1 + i]) \
+                & np.uint64(0xFFFFFFFF)
+        shingles = np.unique(shingles)
+        return np.array([((a * shingles + b) % np.uint64(MINHASH_PRIME)).min()
+                         for a, b in zip(self._a, self._b)], dtype=np.uint64)
+
+    def _band_keys(self, scope: str, signature: np.ndarray) -> List[Tuple[str, int, bytes]]:
+        return [(scope, band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+                for band in range(self.bands)]
+
+    # Lookup and storage
+
+    def _expired(self, entry: CacheEntry) -> bool:
+        return self.ttl is not None and self.clock() - entry.created > self.ttl
+
+    def cost(self, model: str, input_tokens: int, output_tokens: int) -> float:
+        """Price of a call from the model registry; 0 for unknown models."""
+        info = self.token_mgr.get_model_info(model)
+        if not info:
+            return 0.0
+        return (input_tokens / 1000) * info['input_cost_per_1k'] + \
+            (output_tokens / 1000) * info['output_cost_per_1k']
+
+    def get(self, prompt: str, model: str, max_tokens: int,
+            temperature: float = MODEL_CLIENT['temperature'],
+            top_p: float = MODEL_CLIENT['top_p'],
+            top_k: Optional[int] = MODEL_CLIENT['top_k']) -> Optional[CacheHit]:
+        """Return a cached response for the prompt, or None."""
+        normalized = self.normalize(prompt)
+        scope = self.scope(model, max_tokens, temperature, top_p, top_k)
+        key = self.key(normalized, scope)
+
+        with self._lock:
+            entry = self._live(key)
+        similarity = 1.0
+        signature = None
+        if entry is None and self.near_duplicates:
+            signature = self.signature(normalized, model)
+
+        with self._lock:
+            if signature is not None:
+                entry, similarity = self._nearest(signature, scope)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+
+            if entry.key in self.entries:
+                self.entries.move_to_end(entry.key)
+            tokens_saved = entry.input_tokens + entry.output_tokens
+            cost_saved = self.cost(model, entry.input_tokens, entry.output_tokens)
+            self.stats['hits'] += 1
+            self.stats['near_hits'] += int(similarity < 1.0)
+            self.stats['tokens_saved'] += tokens_saved
+            self.stats['cost_saved'] += cost_saved
+
+        completion = Completion(text=entry.text, input_tokens=entry.input_tokens,
+                                output_tokens=entry.output_tokens, model=model, cached=True)
+        return CacheHit(completion=completion, similarity=similarity,
+                        tokens_saved=tokens_saved, cost_saved=cost_saved)
+
+    def _live(self, key: str) -> Optional[CacheEntry]:
+        entry = self.entries.get(key)
+        if entry is not None and self._expired(entry):
+            self._remove(key)
+            self.stats['expired'] += 1
+            return None
+        return entry
+
+    def _nearest(self, signature: np.ndarray, scope: str) -> Tuple[Optional[CacheEntry], float]:
+        """Most similar cached prompt sharing an LSH band, if similar enough."""
+        candidates = set()
+        for band_key in self._band_keys(scope, signature):
+            candidates.update(self.buckets.get(band_key, ()))
+
+        best, best_similarity = None, 0.0
+        for key in candidates:
+            entry = self._live(key)
+            if entry is None:
+                continue
+            similarity = float(np.mean(entry.signature == signature))
+            if similarity > best_similarity:
+                best, best_similarity = entry, similarity
+        if best_similarity < self.similarity:
+            return None, 0.0
+        return best, best_similarity
+
+    def put(self, prompt: str, completion: Completion, max_tokens: int,
+            temperature: float = MODEL_CLIENT['temperature'],
+            top_p: float = MODEL_CLIENT['top_p'],
+            top_k: Optional[int] = MODEL_CLIENT['top_k']):
+        """Store a response for the prompt."""
+        normalized = self.normalize(prompt)
+        scope = self.scope(completion.model, max_tokens, temperature, top_p, top_k)
+        entry = CacheEntry(
+            key=self.key(normalized, scope),
+            scope=scope,
+            text=completion.text,
+            model=completion.model,
+            input_tokens=completion.input_tokens,
+            output_tokens=completion.output_tokens,
+            created=self.clock()
+        )
+        if self.near_duplicates:
+            entry.signature = self.signature(normalized, completion.model)
+
+        with self._lock:
+            self._insert(entry)
+            self._evict()
+
+    def _insert(self, entry: CacheEntry):
+        self._remove(entry.key)
+        self.entries[entry.key] = entry
+        self.total_bytes += entry.size
+        if entry.signature is not None:
+            for band_key in self._band_keys(entry.scope, entry.signature):
+                self.buckets.setdefault(band_key, set()).add(entry.key)
+
+    def _remove(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self.total_bytes -= entry.size
+        if entry.signature is not None:
+            for band_key in self._band_keys(entry.scope, entry.signature):
+                bucket = self.buckets.get(band_key)
+                if bucket is not None:
+                    bucket.discard(key)
+                    if not bucket:
+                        del self.buckets[band_key]
+
+    def _evict(self):
+        """Evict until within limits, preferring cheap-to-recompute old entries."""
+        while self.entries and (len(self.entries) > self.max_entries or
+                                self.total_bytes > self.max_bytes):
+            sample = []
+            for entry in self.entries.values():
+                sample.append(entry)
+                if len(sample) >= self.eviction_sample:
+                    break
+            expired = [entry for entry in sample if self._expired(entry)]
+            if expired:
+                victim = expired[0]
+            else:
+                victim = min(sample, key=lambda e: (e.input_tokens + e.output_tokens) / e.size)
+            self._remove(victim.key)
+            self.stats['evictions'] += 1
+
+    # Persistence
+
+    def _load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+        for record in records:
+            signature = record.pop('signature')
+            entry = CacheEntry(**record)
+            if signature is not None:
+                entry.signature = np.array(signature, dtype=np.uint64)
+            if not self._expired(entry):
+                self._insert(entry)
+        self._evict()
+
+    def save(self):
+        """Write the cache to its path, least recently used first."""
+        if self.path is None:
+            return
+        with self._lock:
+            records = []
+            for entry in self.entries.values():
+                if self._expired(entry):
+                    continue
+                records.append({
+                    'key': entry.key, 'scope': entry.scope, 'text': entry.text,
+                    'model': entry.model, 'input_tokens': entry.input_tokens,
+                    'output_tokens': entry.output_tokens, 'created': entry.created,
+                    'signature': None if entry.signature is None else entry.signature.tolist()
+                })
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(records, f)
+        os.replace(tmp_path, self.path)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class CachedClient(ModelClient):
+    """Model client that answers from a ResponseCache before calling through."""
+
+    def __init__(self, client: ModelClient, cache: ResponseCache,
+                 on_hit: Optional[Callable[[CacheHit], None]] = None):
+        self.client = client
+        self.cache = cache
+        self.on_hit = on_hit
+
+    def lookup(self, prompt: str, model: str, max_tokens: int,
+               temperature: float = MODEL_CLIENT['temperature'],
+               top_p: float = MODEL_CLIENT['top_p'],
+               top_k: Optional[int] = MODEL_CLIENT['top_k']) -> Optional[Completion]:
+        """Return the cached completion for a prompt, or None, without calling through."""
+        hit = self.cache.get(prompt, model, max_tokens, temperature, top_p, top_k)
+        if hit is None:
+            return None
+        if self.on_hit is not None:
+            self.on_hit(hit)
+        return hit.completion
+
+    def complete(self, prompt: str, model: str, max_tokens: int,
+                 temperature: float = MODEL_CLIENT['temperature'],
+                 top_p: float = MODEL_CLIENT['top_p'],
+                 top_k: Optional[int] = MODEL_CLIENT['top_k']) -> Completion:
+        completion = self.lookup(prompt, model, max_tokens, temperature, top_p, top_k)
+        if completion is not None:
+            return completion
+
+        completion = self.client.complete(prompt, model, max_tokens, temperature, top_p, top_k)
+        self.cache.put(prompt, completion, max_tokens, temperature, top_p, top_k)
+        return completion
+
+    def close(self):
+        """Save the cache and close the wrapped client if it needs closing."""
+        self.cache.save()
+        close = getattr(self.client, 'close', None)
+        if close is not None:
+            close()
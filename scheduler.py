@@ -0,0 +1,337 @@
+"""
+Rate-limited scheduling of model calls.
+
+Every request is weighted up front by its prompt tokens plus the reply
+tokens it asks for. Per-model token buckets hold calls back until both the
+requests-per-minute and tokens-per-minute limits have room, small requests
+are coalesced into one batched prompt, and admitted calls run concurrently.
+"""
+
+import asyncio
+import functools
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from config import MODEL_CLIENT, RATE_LIMITS, SCHEDULER
+from model_client import Completion, ModelClient, RateLimitError
+
+BATCH_INSTRUCTION = ("Answer each of the following {count} tasks independently. Start each "
+                     "answer with its marker line, such as '### Task 1', and write nothing "
+                     "outside the answers.")
+TASK_MARKER = re.compile(r"^### Task (\d+)[ \t]*$", re.MULTILINE)
+
+
+def build_batch_prompt(prompts: List[str]) -> str:
+    """Combine several prompts into one prompt with numbered tasks."""
+    parts = [BATCH_INSTRUCTION.format(count=len(prompts))]
+    for i, prompt in enumerate(prompts, 1):
+        parts.append(f"### Task {i}\n{prompt}")
+    return "\n\n".join(parts)
+
+
+def split_batch_response(text: str, count: int) -> Optional[List[str]]:
+    """Split a batched reply into answers, or None if a task is missing."""
+    pieces = TASK_MARKER.split(text)
+    answers = {}
+    for number, answer in zip(pieces[1::2], pieces[2::2]):
+        answers[int(number)] = answer.strip()
+    if sorted(answers) != list(range(1, count + 1)):
+        return None
+    return [answers[i] for i in range(1, count + 1)]
+
+
+class TokenBucket:
+    """Token bucket refilled continuously up to its capacity every period."""
+
+    def __init__(self, capacity: float, period: float = 60.0):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float):
+        """Wait until amount tokens are available and take them."""
+        if amount > self.capacity:
+            raise ValueError(f"Request of {amount} exceeds bucket capacity {self.capacity}")
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        # The lock keeps callers in arrival order, so large requests are not starved
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+@dataclass
+class _Request:
+    """A queued call waiting to be admitted."""
+    prompt: str
+    max_tokens: int
+    params: Tuple
+    weight: int
+    future: asyncio.Future
+    coalesce: bool = True
+
+
+@dataclass
+class _ModelLane:
+    """Queue, limits and dispatcher of one model."""
+    queue: asyncio.Queue
+    requests: TokenBucket
+    tokens: TokenBucket
+    worker: Optional[asyncio.Task] = None
+    in_flight: set = field(default_factory=set)
+    held: List = field(default_factory=list)  # requests the dispatcher is admitting
+
+
+class RequestScheduler:
+    """Schedules model calls under per-model request and token limits."""
+
+    def __init__(self, token_mgr, client, limits: Optional[Dict] = None, period: float = 60.0,
+                 max_concurrency: int = SCHEDULER['max_concurrency'],
+                 coalesce_max_tokens: int = SCHEDULER['coalesce_max_tokens'],
+                 batch_max_tokens: int = SCHEDULER['batch_max_tokens'],
+                 batch_max_requests: int = SCHEDULER['batch_max_requests'],
+                 coalesce_wait: float = SCHEDULER['coalesce_wait'],
+                 max_retries: int = SCHEDULER['max_retries']):
+        self.token_mgr = token_mgr
+        self.client = client
+        self.limits = limits or RATE_LIMITS
+        self.period = period
+        self.max_concurrency = max_concurrency
+        self.coalesce_max_tokens = coalesce_max_tokens
+        self.batch_max_tokens = batch_max_tokens
+        self.batch_max_requests = batch_max_requests
+        self.coalesce_wait = coalesce_wait
+        self.max_retries = max_retries
+
+        self.lanes: Dict[str, _ModelLane] = {}
+        self._semaphore = None
+        self.stats = {'requests': 0, 'calls': 0, 'coalesced': 0, 'retries': 0}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def submit(self, prompt: str, model: str = 'gpt-3.5-turbo', max_tokens: int = 256,
+                     temperature: float = MODEL_CLIENT['temperature'],
+                     top_p: float = MODEL_CLIENT['top_p'],
+                     top_k: Optional[int] = MODEL_CLIENT['top_k']) -> Completion:
+        """Queue a call and wait for its completion."""
+        weight = self.token_mgr.count_tokens(prompt, model) + max_tokens
+        future = asyncio.get_running_loop().create_future()
+        self.stats['requests'] += 1
+        self._lane(model).queue.put_nowait(
+            _Request(prompt, max_tokens, (temperature, top_p, top_k), weight, future))
+        return await future
+
+    async def complete_many(self, prompts: List[str], model: str = 'gpt-3.5-turbo',
+                            max_tokens: int = 256, **params) -> List[Completion]:
+        """Run several prompts concurrently, returning completions in order."""
+        return await asyncio.gather(*(self.submit(prompt, model, max_tokens, **params)
+                                      for prompt in prompts))
+
+    async def close(self):
+        """Stop the dispatchers once all admitted calls have finished.
+
+        Requests that were not admitted yet fail with a RuntimeError rather
+        than leaving their callers waiting.
+        """
+        error = RuntimeError("Scheduler closed before the request was sent")
+        for lane in self.lanes.values():
+            if lane.in_flight:
+                await asyncio.gather(*lane.in_flight, return_exceptions=True)
+            lane.worker.cancel()
+            try:
+                await lane.worker
+            except asyncio.CancelledError:
+                pass
+            # Calls admitted meanwhile may still re-queue their requests
+            if lane.in_flight:
+                await asyncio.gather(*lane.in_flight, return_exceptions=True)
+            self._fail(lane.held, error)
+            while not lane.queue.empty():
+                self._fail([lane.queue.get_nowait()], error)
+        self.lanes.clear()
+
+    def _lane(self, model: str) -> _ModelLane:
+        """Return the lane of a model, starting its dispatcher on first use."""
+        lane = self.lanes.get(model)
+        if lane is None:
+            limits = self.limits.get(model, self.limits['default'])
+            lane = _ModelLane(
+                queue=asyncio.Queue(),
+                requests=TokenBucket(limits['requests_per_minute'], self.period),
+                tokens=TokenBucket(limits['tokens_per_minute'], self.period)
+            )
+            self.lanes[model] = lane
+            lane.worker = asyncio.ensure_future(self._dispatch(model, lane))
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return lane
+
+    def _can_coalesce(self, request: _Request) -> bool:
+        return request.coalesce and request.weight <= self.coalesce_max_tokens
+
+    async def _dispatch(self, model: str, lane: _ModelLane):
+        """Collect queued requests into batches and admit them under the limits."""
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = lane.held = [await lane.queue.get()]
+
+            if self._can_coalesce(pending[0]):
+                deadline = loop.time() + self.coalesce_wait
+                while len(pending) < self.batch_max_requests:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        pending.append(await asyncio.wait_for(lane.queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+
+            for batch in self._make_batches(pending, lane.tokens.capacity):
+                prompt, max_tokens = self._batch_prompt(batch)
+                weight = batch[0].weight if len(batch) == 1 else \
+                    self.token_mgr.count_tokens(prompt, model) + max_tokens
+                if weight > lane.tokens.capacity:
+                    error = ValueError(f"Request of {weight} tokens exceeds the "
+                                       f"tokens_per_minute limit of {model}")
+                    self._fail(batch, error)
+                    continue
+
+                await self._semaphore.acquire()
+                await lane.requests.acquire(1)
+                await lane.tokens.acquire(weight)
+
+                task = asyncio.ensure_future(self._run(model, lane, batch, prompt, max_tokens))
+                lane.in_flight.add(task)
+                task.add_done_callback(lane.in_flight.discard)
+            lane.held = []
+
+    @staticmethod
+    def _fail(batch: List[_Request], error: Exception):
+        for request in batch:
+            if not request.future.done():
+                request.future.set_exception(error)
+
+    def _make_batches(self, pending: List[_Request], capacity: float) -> List[List[_Request]]:
+        """Group coalescable requests with equal sampling params by weight."""
+        max_weight = min(self.batch_max_tokens, capacity)
+        batches = []
+        open_batches: Dict[Tuple, List[_Request]] = {}
+        for request in pending:
+            if not self._can_coalesce(request):
+                batches.append([request])
+                continue
+            batch = open_batches.get(request.params)
+            if batch is not None and (len(batch) >= self.batch_max_requests or
+                                      sum(r.weight for r in batch) + request.weight >
+                                      max_weight):
+                batch = None
+            if batch is None:
+                batch = []
+                open_batches[request.params] = batch
+                batches.append(batch)
+            batch.append(request)
+        return batches
+
+    @staticmethod
+    def _batch_prompt(batch: List[_Request]) -> Tuple[str, int]:
+        if len(batch) == 1:
+            return batch[0].prompt, batch[0].max_tokens
+        return build_batch_prompt([r.prompt for r in batch]), sum(r.max_tokens for r in batch)
+
+    async def _run(self, model: str, lane: _ModelLane, batch: List[_Request],
+                   prompt: str, max_tokens: int):
+        """Make one admitted call and resolve the futures of its requests."""
+        try:
+            completion = await self._call(model, prompt, max_tokens, batch[0].params)
+            if len(batch) == 1:
+                if not batch[0].future.done():
+                    batch[0].future.set_result(completion)
+                return
+
+            answers = split_batch_response(completion.text, len(batch))
+            if answers is None:
+                # The model did not keep the task markers; send each request alone
+                for request in batch:
+                    request.coalesce = False
+                    lane.queue.put_nowait(request)
+                return
+
+            self.stats['coalesced'] += len(batch)
+            for request, answer in zip(batch, answers):
+                if request.future.done():
+                    continue
+                request.future.set_result(Completion(
+                    text=answer,
+                    input_tokens=self.token_mgr.count_tokens(request.prompt, model),
+                    output_tokens=self.token_mgr.count_tokens(answer, model),
+                    model=model
+                ))
+        except Exception as e:
+            self._fail(batch, e)
+        finally:
+            self._semaphore.release()
+
+    async def _call(self, model: str, prompt: str, max_tokens: int, params: Tuple) -> Completion:
+        """Call the client in a worker thread, retrying after rate limit errors."""
+        temperature, top_p, top_k = params
+        call = functools.partial(self.client.complete, prompt, model, max_tokens,
+                                 temperature=temperature, top_p=top_p, top_k=top_k)
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.stats['calls'] += 1
+                return await loop.run_in_executor(None, call)
+            except RateLimitError as e:
+                if attempt == self.max_retries:
+                    raise
+                self.stats['retries'] += 1
+                await asyncio.sleep(e.retry_after if e.retry_after is not None
+                                    else 0.5 * 2 ** attempt)
+
+
+class ScheduledClient(ModelClient):
+    """Synchronous client that routes calls through a RequestScheduler.
+
+    The scheduler runs on its own event loop in a background thread, so
+    threaded callers such as the summarizer share its limits and batching.
+    """
+
+    def __init__(self, scheduler: RequestScheduler):
+        self.scheduler = scheduler
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def complete(self, prompt: str, model: str, max_tokens: int,
+                 temperature: float = MODEL_CLIENT['temperature'],
+                 top_p: float = MODEL_CLIENT['top_p'],
+                 top_k: Optional[int] = MODEL_CLIENT['top_k']) -> Completion:
+        call = self.scheduler.submit(prompt, model, max_tokens,
+                                     temperature=temperature, top_p=top_p, top_k=top_k)
+        return asyncio.run_coroutine_threadsafe(call, self.loop).result()
+
+    def close(self):
+        """Finish outstanding calls and stop the background loop."""
+        asyncio.run_coroutine_threadsafe(self.scheduler.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
@@ -0,0 +1,164 @@
+"""
+Deduplicated token counting using content-defined chunking.
+
+Documents are cut into segments at content-defined boundaries: a rolling
+hash over line hashes decides where a segment ends, so identical runs of
+lines (templates, pasted references, repeated headers) produce identical
+segments wherever they appear. Each distinct segment is encoded once and
+its token count is reused from a shared segment table.
+"""
+
+import hashlib
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+from config import DEDUP
+
+
+def _digest(text: str) -> bytes:
+    """Return a compact content hash for a segment."""
+    return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+
+class SegmentCounter:
+    """Counts tokens by summing cached counts of content-defined segments.
+
+    Cuts are only placed where a newline is followed by a line starting with
+    a non-space character. That position is a pre-tokenizer boundary for the
+    tiktoken encodings, so segment counts add up exactly. For any other
+    encoding, a junction correction computed over the lines on either side
+    of every cut keeps totals exact if it merges across the cut.
+    """
+
+    def __init__(self, token_mgr, avg_segment_lines: int = DEDUP['avg_segment_lines'],
+                 min_segment_lines: int = DEDUP['min_segment_lines'],
+                 max_segment_lines: int = DEDUP['max_segment_lines'],
+                 table_size: int = DEDUP['table_size'],
+                 clean_cut_encodings: List[str] = DEDUP['clean_cut_encodings']):
+        if avg_segment_lines < 1 or avg_segment_lines & (avg_segment_lines - 1):
+            raise ValueError("avg_segment_lines must be a power of two")
+
+        self.token_mgr = token_mgr
+        self.mask = avg_segment_lines - 1
+        self.min_segment_lines = min_segment_lines
+        self.max_segment_lines = max_segment_lines
+        self.table_size = table_size
+        self.clean_cut_encodings = set(clean_cut_encodings)
+
+        # (model, digest) -> token count, kept in LRU order
+        self.segments: "OrderedDict[Tuple[str, bytes], int]" = OrderedDict()
+        self.junctions: "OrderedDict[Tuple[str, bytes], int]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def split_segments(self, text: str) -> List[str]:
+        """Split text into content-defined segments that join back to text."""
+        lines = text.splitlines(keepends=True)
+        segments = []
+        start = 0
+        rolling = 0
+
+        for i, line in enumerate(lines):
+            # Gear-style rolling hash: the low bits only depend on the last
+            # few lines, so boundaries resynchronise right after an edit.
+            line_hash = zlib.crc32(line.encode('utf-8', 'surrogatepass'))
+            rolling = ((rolling << 1) + line_hash) & 0xFFFFFFFF
+
+            length = i + 1 - start
+            if length < self.min_segment_lines:
+                continue
+            if (rolling & self.mask) != 0 and length < self.max_segment_lines:
+                continue
+            if not self._is_safe_cut(lines, i):
+                continue
+
+            segments.append("".join(lines[start:i + 1]))
+            start = i + 1
+
+        if start < len(lines):
+            segments.append("".join(lines[start:]))
+
+        return segments
+
+    def count_tokens(self, text: str, model: str = 'gpt-3.5-turbo') -> int:
+        """Count exact tokens for text, reusing counts of known segments."""
+        segments = self.split_segments(text)
+        total = 0
+
+        for segment in segments:
+            total += self._segment_tokens(segment, model)
+
+        if self._needs_correction(model):
+            for left, right in zip(segments, segments[1:]):
+                total += self._junction_correction(left, right, model)
+
+        return total
+
+    def count_corpus(self, texts: List[str], model: str = 'gpt-3.5-turbo') -> List[int]:
+        """Count tokens for many documents sharing one segment table."""
+        return [self.count_tokens(text, model) for text in texts]
+
+    def get_stats(self) -> Dict:
+        """Return segment table statistics."""
+        lookups = self.hits + self.misses
+        return {
+            'segments': len(self.segments),
+            'junctions': len(self.junctions),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+    def clear(self):
+        """Drop all cached segment and junction counts."""
+        self.segments.clear()
+        self.junctions.clear()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _is_safe_cut(lines: List[str], i: int) -> bool:
+        """Check whether a segment may end after line i."""
+        if i + 1 >= len(lines) or not lines[i].endswith('\n'):
+            return False
+        return not lines[i + 1][:1].isspace()
+
+    def _segment_tokens(self, segment: str, model: str) -> int:
+        """Look up or compute the token count of a single segment."""
+        key = (model, _digest(segment))
+        count = self.segments.get(key)
+        if count is not None:
+            self.hits += 1
+            self.segments.move_to_end(key)
+            return count
+
+        self.misses += 1
+        count = self.token_mgr.count_tokens(segment, model)
+        self._store(self.segments, key, count)
+        return count
+
+    def _needs_correction(self, model: str) -> bool:
+        """Check whether the model's encoding may merge tokens across a cut."""
+        encoder = self.token_mgr.encoders.get(model)
+        return getattr(encoder, 'name', None) not in self.clean_cut_encodings
+
+    def _junction_correction(self, left: str, right: str, model: str) -> int:
+        """Token difference between encoding a cut jointly and separately."""
+        tail = left[left.rfind('\n', 0, len(left) - 1) + 1:]
+        newline = right.find('\n')
+        head = right if newline < 0 else right[:newline + 1]
+
+        key = (model, _digest(tail + '\x00' + head))
+        delta = self.junctions.get(key)
+        if delta is None:
+            count = self.token_mgr.count_tokens
+            delta = count(tail + head, model) - count(tail, model) - count(head, model)
+            self._store(self.junctions, key, delta)
+        return delta
+
+    def _store(self, table: OrderedDict, key: Tuple[str, bytes], value: int):
+        """Insert into an LRU table, evicting the oldest entry when full."""
+        table[key] = value
+        if len(table) > self.table_size:
+            table.popitem(last=False)
@@ -33,6 +33,7 @@ setup(
     entry_points={
         "console_scripts": [
             "token-manager=token_cli:main",
+            "nm=notemind_cli:main",
         ],
     },
     keywords="tokens, tokenization, AI, language models, GPT, Claude, cost optimization",
@@ -0,0 +1,240 @@
+"""
+Map-reduce summarization for notes larger than a model's context window.
+
+Notes are encoded once and cut into token windows with
+TokenManager.chunk_tokens, preferring sentence ends, so a long run of text
+without punctuation cannot overflow a chunk. Each chunk is summarized
+concurrently (map), and the partial summaries are combined in groups that
+fit the context window until a single summary is left (reduce). Every
+call's result is cached by a hash of its prompt, so re-summarizing an
+edited note only repeats the calls whose input changed.
+"""
+
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from config import CHUNKING, SUMMARY
+
+MAP_INSTRUCTION = "Summarize the following note excerpt as concise bullet points."
+REDUCE_INSTRUCTION = "Combine the following partial summaries into one concise bullet-point summary."
+
+
+@dataclass
+class StageReport:
+    """Token usage and cost of one map or reduce stage."""
+    name: str
+    calls: int
+    cache_hits: int
+    input_tokens: int
+    output_tokens: int
+    cost: float
+
+
+@dataclass
+class SummaryResult:
+    """Final summary of a text and how it was produced."""
+    summary: str
+    model: str
+    chunk_count: int
+    stages: List[StageReport] = field(default_factory=list)
+
+    @property
+    def total_cost(self) -> float:
+        return sum(stage.cost for stage in self.stages)
+
+    @property
+    def cache_hits(self) -> int:
+        return sum(stage.cache_hits for stage in self.stages)
+
+
+class SummaryCache:
+    """Summaries keyed by prompt hash, on disk or in memory."""
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.cache_dir = cache_dir
+        self.memory: Dict[str, str] = {}
+
+    @staticmethod
+    def key(model: str, prompt: str, max_tokens: int) -> str:
+        """Hash everything that determines a summary."""
+        data = f"{model}\0{max_tokens}\0{prompt}".encode('utf-8')
+        return hashlib.sha256(data).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, key: str) -> Optional[str]:
+        """Return a cached summary, or None."""
+        if key in self.memory or self.cache_dir is None:
+            return self.memory.get(key)
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                self.memory[key] = f.read()
+        except FileNotFoundError:
+            return None
+        return self.memory[key]
+
+    def put(self, key: str, summary: str):
+        """Store a summary."""
+        self.memory[key] = summary
+        if self.cache_dir is None:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(summary)
+        os.replace(path + '.tmp', path)
+
+
+class Summarizer:
+    """Summarizes texts of any length with a pluggable model client."""
+
+    def __init__(self, token_mgr, client, model: str = 'gpt-3.5-turbo',
+                 cache: Optional[SummaryCache] = None,
+                 chunk_tokens: int = CHUNKING['default_max_tokens'],
+                 summary_tokens: int = SUMMARY['summary_tokens'],
+                 max_workers: int = SUMMARY['max_workers'],
+                 max_cost: Optional[float] = SUMMARY['max_cost']):
+        self.model_info = token_mgr.get_model_info(model)
+        if not self.model_info:
+            raise ValueError(f"Model {model} not supported")
+
+        self.token_mgr = token_mgr
+        self.client = client
+        self.model = model
+        self.cache = cache or SummaryCache()
+        self.summary_tokens = summary_tokens
+        self.max_workers = max_workers
+        self.max_cost = max_cost
+
+        # Room left for content once the instruction and the reply are accounted for
+        overhead = max(token_mgr.count_tokens(f"{instruction}\n\n", model)
+                       for instruction in (MAP_INSTRUCTION, REDUCE_INSTRUCTION))
+        self.input_budget = self.model_info['context_window'] - overhead - summary_tokens
+        if self.input_budget <= 0:
+            raise ValueError(f"summary_tokens={summary_tokens} leaves no room in the "
+                             f"context window of {model}")
+        self.chunk_tokens = min(chunk_tokens, self.input_budget)
+
+    def summarize(self, text: str) -> SummaryResult:
+        """Summarize text, reducing partial summaries until one is left."""
+        tokens = self.token_mgr.encode(text, self.model)
+        chunks = self.token_mgr.chunk_tokens(tokens, self.chunk_tokens, self.model)
+        result = SummaryResult(summary="", model=self.model, chunk_count=len(chunks))
+        if not chunks:
+            return result
+
+        summaries = self._run_stage('map', MAP_INSTRUCTION, chunks, result.stages)
+        level = 1
+        while len(summaries) > 1:
+            groups = self._group(summaries)
+            if len(groups) == len(summaries):
+                raise ValueError("Partial summaries are too long to combine; "
+                                 "lower summary_tokens")
+            summaries = self._run_stage(f'reduce-{level}', REDUCE_INSTRUCTION,
+                                        ["\n".join(group) for group in groups], result.stages)
+            level += 1
+
+        result.summary = summaries[0]
+        return result
+
+    def estimate_cost(self, input_tokens: int, output_tokens: int) -> float:
+        """Cost of a call from the model registry prices."""
+        return (input_tokens / 1000) * self.model_info['input_cost_per_1k'] + \
+            (output_tokens / 1000) * self.model_info['output_cost_per_1k']
+
+    def _group(self, summaries: List[str]) -> List[List[str]]:
+        """Pack consecutive summaries into groups that fit the input budget."""
+        groups = []
+        current = []
+        current_tokens = 0
+        for summary in summaries:
+            tokens = self.token_mgr.count_tokens(summary, self.model) + 1
+            if current and current_tokens + tokens > self.input_budget:
+                groups.append(current)
+                current = []
+                current_tokens = 0
+            current.append(summary)
+            current_tokens += tokens
+        if current:
+            groups.append(current)
+        return groups
+
+    def _run_stage(self, name: str, instruction: str, texts: List[str],
+                   stages: List[StageReport]) -> List[str]:
+        """Summarize each text, calling the model only for uncached prompts."""
+        prompts = [f"{instruction}\n\n{text}" for text in texts]
+        keys = [SummaryCache.key(self.model, prompt, self.summary_tokens) for prompt in prompts]
+
+        results = {}
+        for key in keys:
+            cached = self.cache.get(key)
+            if cached is not None:
+                results[key] = cached
+        cache_hits = sum(1 for key in keys if key in results)
+
+        # Identical prompts within a stage are only sent once
+        pending = {key: prompt for key, prompt in zip(keys, prompts) if key not in results}
+
+        # Prompts a response cache in front of the client can answer are
+        # neither priced nor sent
+        answered = {}
+        lookup = getattr(self.client, 'lookup', None)
+        if lookup is not None:
+            for key, prompt in pending.items():
+                completion = lookup(prompt, self.model, self.summary_tokens)
+                if completion is not None:
+                    answered[key] = completion
+        pending = {key: prompt for key, prompt in pending.items() if key not in answered}
+
+        prompt_tokens = [self.token_mgr.count_tokens(prompt, self.model)
+                         for prompt in pending.values()]
+        limit = self.model_info['context_window'] - self.summary_tokens
+        if any(tokens > limit for tokens in prompt_tokens):
+            raise ValueError(f"Stage {name} has a prompt of {max(prompt_tokens)} tokens, "
+                             f"more than the {limit} left for input in the context "
+                             f"window of {self.model}")
+        input_tokens = sum(prompt_tokens)
+        estimate = self.estimate_cost(input_tokens, len(pending) * self.summary_tokens)
+        spent = sum(stage.cost for stage in stages)
+        if self.max_cost is not None and spent + estimate > self.max_cost:
+            raise ValueError(f"Stage {name} would cost up to ${estimate:.6f}, "
+                             f"exceeding the budget of ${self.max_cost:.6f}")
+
+        completions = []
+        if pending:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                completions = list(pool.map(
+                    lambda prompt: self.client.complete(prompt, self.model, self.summary_tokens),
+                    pending.values()))
+
+        output_tokens = 0
+        input_tokens = 0
+        calls = len(pending)
+        for key, completion in [*answered.items(), *zip(pending, completions)]:
+            summary = completion.text.strip()
+            results[key] = summary
+            if completion.cached:
+                # Answered by a response cache in front of the client, which
+                # owns its expiry; a near-duplicate answer must not be stored
+                # under this prompt's exact key
+                if key in pending:
+                    calls -= 1
+                cache_hits += 1
+                continue
+            self.cache.put(key, summary)
+            input_tokens += completion.input_tokens
+            output_tokens += completion.output_tokens
+
+        stages.append(StageReport(
+            name=name,
+            calls=calls,
+            cache_hits=cache_hits,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            cost=self.estimate_cost(input_tokens, output_tokens)
+        ))
+        return [results[key] for key in keys]
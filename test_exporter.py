@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Tests for streaming export.
+"""
+
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+from unittest.mock import patch
+import exporter
+import token_cli
+from exporter import Exporter, export, get_serializer
+from token_cli import batch_records
+from test_support import SPLIT, StandInEncoding
+from token_manager import TokenManager
+
+NOTES = [
+    {'id': 1, 'created': 1.5, 'tokens': 3, 'summary': 'Short.', 'text': 'First note.'},
+    {'id': 2, 'created': 2.5, 'tokens': None, 'text': 'Zweite Notiz, naïve ✓'},
+]
+
+
+class CountingStream(io.BytesIO):
+    """Binary stream that records how many writes it received."""
+
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        return super().write(data)
+
+
+class TestExporter(unittest.TestCase):
+    """Test cases for Exporter."""
+
+    def render(self, items, fmt, **kwargs):
+        out = io.BytesIO()
+        Exporter(out, fmt).write(items, **kwargs)
+        return out.getvalue().decode('utf-8')
+
+    def test_json_array_and_object(self):
+        self.assertEqual(json.loads(self.render(iter(NOTES), 'json')), NOTES)
+        self.assertEqual(json.loads(self.render(iter([]), 'json')), [])
+
+        text = self.render(iter(["a", "b"]), 'json', fields={'model': 'gpt-4'},
+                           key='chunks', count_field='chunk_count')
+        self.assertEqual(json.loads(text),
+                         {'model': 'gpt-4', 'chunks': ["a", "b"], 'chunk_count': 2})
+
+    def test_jsonl(self):
+        lines = self.render(iter(NOTES), 'jsonl', fields={'ignored': True}).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], NOTES)
+
+    def test_markdown(self):
+        text = self.render(iter(NOTES), 'markdown', title='Notes', label='Note')
+        self.assertTrue(text.startswith("# Notes\n\n## Note 1\n\n- **created**: 1.5\n"))
+        self.assertIn("> Short.\n\nFirst note.\n\n## Note 2", text)
+        self.assertNotIn("None", text)
+        self.assertIn("Zweite Notiz, naïve ✓", text)
+
+    def test_serializers_agree(self):
+        if exporter.orjson is None:
+            self.skipTest("orjson is not installed")
+        records = NOTES + [{'nested': [1.25, None, True], 'text': 'é\n"q"'}]
+        for record in records:
+            self.assertEqual(get_serializer('orjson')(record), get_serializer('json')(record))
+        with self.assertRaises(ValueError):
+            get_serializer('pickle')
+
+    def test_writes_while_consuming(self):
+        """Output is flushed in buffered writes before the generator is exhausted."""
+        out = CountingStream()
+        exporter_ = Exporter(out, 'jsonl', buffer_bytes=200)
+        seen = []
+
+        def records():
+            for i in range(100):
+                seen.append(out.writes)
+                yield {'id': i, 'text': 'x' * 30}
+
+        self.assertEqual(exporter_.write(records()), 100)
+        self.assertGreater(seen[-1], 0)
+        self.assertLess(out.writes, 100)
+        self.assertEqual(len(out.getvalue().splitlines()), 100)
+
+    def test_paths_and_text_streams(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'notes.json')
+            self.assertEqual(export(iter(NOTES), path, 'json'), 2)
+            with open(path, 'r', encoding='utf-8') as f:
+                self.assertEqual(json.load(f), NOTES)
+
+        stream = io.StringIO()
+        stream.write("before\n")
+        export(["naïve"], stream, 'text')
+        self.assertEqual(stream.getvalue(), "before\nnaïve\n")
+
+        with self.assertRaises(ValueError):
+            Exporter(io.BytesIO(), 'yaml')
+
+    def test_batch_records(self):
+        """Batch statistics are streamed per file; unreadable files are reported."""
+        with patch('tiktoken.get_encoding', return_value=StandInEncoding(SPLIT)):
+            token_mgr = TokenManager()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'a.txt')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write("one two three")
+            missing = os.path.join(tmp, 'missing.txt')
+            records = list(batch_records(token_mgr, [path, missing], 'gpt-4'))
+        self.assertEqual(records[0]['tokens'], 3)
+        self.assertAlmostEqual(records[0]['cost'], 3 / 1000 * 0.03)
+        self.assertEqual(records[1]['file'], missing)
+        self.assertIn('error', records[1])
+
+    def test_cli_rejects_unknown_model_before_writing(self):
+        """Errors go to stderr and nothing is streamed for an unsupported model."""
+        stdout, stderr = io.StringIO(), io.StringIO()
+        argv = ['token_cli.py', '--text', 'a b. c d.', '--action', 'chunk',
+                '--max-tokens', '3', '--model', 'bogus', '--output', 'json']
+        with patch('tiktoken.get_encoding', return_value=StandInEncoding()), \
+                patch('sys.argv', argv), redirect_stdout(stdout), redirect_stderr(stderr):
+            with self.assertRaises(SystemExit):
+                token_cli.main()
+        self.assertEqual(stdout.getvalue(), "")
+        self.assertIn("Model bogus not supported", stderr.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Tests for the inverted keyword index.
+"""
+
+import tempfile
+import unittest
+from unittest.mock import patch
+from keyword_index import (KeywordIndex, encode_varints, decode_varints,
+                           encode_postings, decode_postings)
+from test_support import SPLIT, StandInEncoding
+from token_manager import TokenManager
+
+
+class TestEncoding(unittest.TestCase):
+    """Test cases for varint and postings encoding."""
+
+    def test_varint_round_trip(self):
+        values = [0, 1, 127, 128, 300, 2 ** 40]
+        self.assertEqual(decode_varints(encode_varints(values)), values)
+        self.assertEqual(len(encode_varints([127])), 1)
+
+    def test_postings_round_trip(self):
+        postings = [(3, 1), (10, 4), (1000, 2)]
+        self.assertEqual(decode_postings(encode_postings(postings)), postings)
+
+
+class TestKeywordIndex(unittest.TestCase):
+    """Test cases for KeywordIndex."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.index = KeywordIndex(self.tmp.name)
+        self.index.add(1, "Neural networks mimic the neurons of the brain")
+        self.index.add(2, "Gradient descent trains neural networks")
+        self.index.add(3, "Bread needs flour, water and yeast")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_bm25_ranking(self):
+        """Notes matching more and rarer query terms rank higher."""
+        results = self.index.search("neural brain")
+        self.assertEqual([r.note_id for r in results], [1, 2])
+        self.assertGreater(results[0].score, results[1].score)
+        self.assertEqual(self.index.search("unrelated"), [])
+
+    def test_incremental_add_persists(self):
+        """Adds append to disk and are visible after reopening."""
+        self.index.add_many([(4, "Yeast makes bread rise"), (5, "Sourdough bread")])
+        reopened = KeywordIndex(self.tmp.name)
+        self.assertEqual(len(reopened), 5)
+        self.assertEqual(sorted(n for n, _ in reopened.postings("bread")), [3, 4, 5])
+        self.assertEqual(len(reopened.terms["bread"]), 2)
+
+    def test_compact_merges_blocks(self):
+        """Compaction leaves one block per term and the same results."""
+        self.index.add(4, "More neural notes")
+        before = [(r.note_id, round(r.score, 6)) for r in self.index.search("neural")]
+        self.index.compact()
+
+        reopened = KeywordIndex(self.tmp.name)
+        self.assertEqual(len(reopened.terms["neural"]), 1)
+        after = [(r.note_id, round(r.score, 6)) for r in reopened.search("neural")]
+        self.assertEqual(before, after)
+
+    def test_readd_and_remove(self):
+        """Re-adding a note replaces its postings; removed notes disappear."""
+        self.index.add(1, "Sourdough bread starter")
+        self.index.remove([3, 99])
+        for index in (self.index, KeywordIndex(self.tmp.name)):
+            self.assertEqual(len(index), 2)
+            self.assertEqual([r.note_id for r in index.search("neural")], [2])
+            self.assertEqual([r.note_id for r in index.search("bread")], [1])
+
+        self.index.compact()
+        reopened = KeywordIndex(self.tmp.name)
+        self.assertEqual(sorted(reopened.postings("neural")), [(2, 1)])
+        self.assertNotIn("yeast", reopened.terms)
+
+    def test_snippet_fits_token_budget(self):
+        """Snippets are centred on a match and trimmed to the budget."""
+        with patch('tiktoken.get_encoding', return_value=StandInEncoding(SPLIT)):
+            token_mgr = TokenManager()
+
+        text = " ".join(f"filler{i}" for i in range(50)) + " neural " + \
+            " ".join(f"tail{i}" for i in range(50))
+        snippet = self.index.snippet(token_mgr, text, "neural", max_tokens=9)
+        self.assertIn("neural", snippet)
+        self.assertLessEqual(token_mgr.count_tokens(snippet), 9)
+        self.assertEqual(self.index.snippet(token_mgr, "", "neural"), "")
+
+
+if __name__ == '__main__':
+    unittest.main()
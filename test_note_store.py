@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Tests for the log-structured note store.
+"""
+
+import glob
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from note_store import INDEX_DTYPE, NoteStore
+
+
+class TestNoteStore(unittest.TestCase):
+    """Test cases for NoteStore."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def segments(self):
+        return sorted(glob.glob(os.path.join(self.tmp.name, 'notes-*.seg')))
+
+    def test_add_and_reload(self):
+        """Notes survive reopening the store."""
+        store = NoteStore(self.tmp.name)
+        first = store.add("Neural networks mimic neurons.")
+        second = store.add("Gradient descent minimises loss. ✓")
+        self.assertNotEqual(first.id, second.id)
+
+        reopened = NoteStore(self.tmp.name)
+        self.assertEqual(len(reopened), 2)
+        self.assertEqual(reopened.get(second.id).text, second.text)
+        self.assertEqual(bytes(reopened.get_bytes(first.id)), first.text.encode('utf-8'))
+        self.assertIsNone(reopened.get(99))
+
+    def test_update_and_delete(self):
+        """Updates and deletes append records and survive reopening."""
+        store = NoteStore(self.tmp.name, compact_ratio=1.0)
+        note = store.add("First draft")
+        other = store.add("Keep me")
+        store.update(note.id, "Second draft")
+        self.assertTrue(store.delete(other.id))
+        self.assertFalse(store.delete(other.id))
+        with self.assertRaises(KeyError):
+            store.update(other.id, "gone")
+
+        reopened = NoteStore(self.tmp.name)
+        self.assertEqual(reopened.get(note.id).text, "Second draft")
+        self.assertEqual(reopened.get(note.id).created, note.created)
+        self.assertNotIn(other.id, reopened)
+        self.assertEqual([n.id for n in reopened.list_notes()], [note.id])
+
+    def test_token_count_cached(self):
+        """Token counts are computed once and stored with the record."""
+        token_mgr = MagicMock()
+        token_mgr.count_tokens.return_value = 7
+        store = NoteStore(self.tmp.name, token_mgr=token_mgr)
+        note = store.add("Seven tokens, supposedly.")
+        given = store.add("Counted elsewhere", token_count=3)
+        self.assertEqual(token_mgr.count_tokens.call_count, 1)
+
+        reopened = NoteStore(self.tmp.name)
+        self.assertEqual(reopened.token_count(note.id), 7)
+        self.assertEqual(reopened.get(given.id).token_count, 3)
+
+    def test_recovers_records_missing_from_index(self):
+        """Records written after the last index entry are recovered."""
+        store = NoteStore(self.tmp.name)
+        store.add("indexed")
+        store.add("only in the segment")
+        store.close()
+        index_path = os.path.join(self.tmp.name, 'notes.idx')
+        with open(index_path, 'r+b') as f:
+            f.truncate(INDEX_DTYPE.itemsize)
+
+        reopened = NoteStore(self.tmp.name)
+        self.assertEqual(reopened.get(2).text, "only in the segment")
+        self.assertEqual(os.path.getsize(index_path), 2 * INDEX_DTYPE.itemsize)
+        self.assertEqual(reopened.add("next").id, 3)
+
+    def test_torn_record_is_dropped(self):
+        """A partially written record is cut off on startup."""
+        store = NoteStore(self.tmp.name)
+        store.add("complete")
+        store.close()
+        with open(self.segments()[-1], 'ab') as f:
+            f.write(b'\x01\x02\x03partial record')
+
+        reopened = NoteStore(self.tmp.name)
+        self.assertEqual(len(reopened), 1)
+        self.assertEqual(reopened.add("after crash").id, 2)
+        self.assertEqual(NoteStore(self.tmp.name).get(2).text, "after crash")
+
+    def test_segment_rollover(self):
+        """Small segments roll over and all notes stay readable."""
+        store = NoteStore(self.tmp.name, segment_bytes=200)
+        texts = [f"note number {i} " * 3 for i in range(20)]
+        for text in texts:
+            store.add(text)
+        self.assertGreater(len(self.segments()), 1)
+        reopened = NoteStore(self.tmp.name, segment_bytes=200)
+        self.assertEqual([n.text for n in reopened.list_notes()], texts)
+
+    def test_compaction(self):
+        """Compaction keeps live notes, drops old segments and never reuses ids."""
+        store = NoteStore(self.tmp.name, segment_bytes=300, compact_ratio=1.0)
+        ids = [store.add(f"version 0 of note {i}").id for i in range(10)]
+        for version in range(1, 4):
+            for note_id in ids[:5]:
+                store.update(note_id, f"version {version} of note {note_id}")
+        store.delete(ids[-1])
+        before = sum(os.path.getsize(path) for path in self.segments())
+        self.assertGreater(store.dead_ratio(), 0.5)
+
+        store.compact(background=True).join()
+        after = sum(os.path.getsize(path) for path in self.segments())
+        self.assertLess(after, before)
+        self.assertLess(store.dead_ratio(), 0.01)
+        self.assertEqual(store.get(ids[0]).text, f"version 3 of note {ids[0]}")
+        store.close()
+
+        reopened = NoteStore(self.tmp.name)
+        self.assertEqual(len(reopened), 9)
+        self.assertEqual(reopened.get(ids[8]).text, "version 0 of note 8")
+        self.assertEqual(reopened.add("new").id, ids[-1] + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
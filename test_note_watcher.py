@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Tests for watch mode.
+"""
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from note_store import NoteStore
+from note_watcher import NoteWatcher, scan
+from test_support import SPLIT, StandInEncoding
+from token_manager import TokenManager
+
+
+class TestNoteWatcher(unittest.TestCase):
+    """Test cases for NoteWatcher."""
+
+    def setUp(self):
+        self.encoder = StandInEncoding(SPLIT)
+        with patch('tiktoken.get_encoding', return_value=self.encoder):
+            self.token_mgr = TokenManager()
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.vault = os.path.join(self.tmp.name, 'vault')
+        os.makedirs(os.path.join(self.vault, 'sub'))
+        self.store = NoteStore(os.path.join(self.vault, '.notemind'))
+        self.watcher = self.make_watcher()
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def make_watcher(self):
+        return NoteWatcher(self.vault, self.store, self.token_mgr, debounce=0.5, batch_size=2)
+
+    def write(self, name, text, mtime_ns=None):
+        path = os.path.join(self.vault, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        if mtime_ns is not None:
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+        return path
+
+    def test_scan_skips_hidden_and_other_files(self):
+        """Only note files outside hidden directories are scanned."""
+        self.write('a.md', "alpha")
+        self.write('sub/b.txt', "beta")
+        self.write('image.png', "binary")
+        self.write('.hidden.md', "secret")
+        self.store.add("stored")
+        found = scan(self.vault, ('.md', '.txt'))
+        self.assertEqual(sorted(os.path.relpath(p, self.vault) for p in found),
+                         ['a.md', os.path.join('sub', 'b.txt')])
+
+    def test_sync_adds_updates_and_deletes(self):
+        """Only changed files are re-encoded and re-indexed."""
+        first = self.write('a.md', "neural networks learn")
+        self.write('sub/b.md', "bread needs yeast")
+        self.write('c.md', "gradient descent")
+        report = self.watcher.sync()
+        self.assertEqual(len(report.added), 3)
+        self.assertEqual(len(self.store), 3)
+
+        calls = self.encoder.calls
+        report = self.watcher.sync()
+        self.assertEqual(report.summary()['added'] + report.summary()['updated'], 0)
+        self.assertEqual(self.encoder.calls, calls)
+
+        self.write('a.md', "sourdough starter", mtime_ns=10 ** 18)
+        os.remove(os.path.join(self.vault, 'c.md'))
+        report = self.watcher.sync()
+        self.assertEqual((report.updated, len(report.deleted)), ([first], 1))
+        self.assertEqual(self.encoder.calls, calls + 1)
+
+        note_id = self.watcher.files[first].note_id
+        self.assertEqual(self.store.get(note_id).text, "sourdough starter")
+        self.assertEqual(self.store.token_count(note_id), 2)
+        self.assertEqual(len(self.store), 2)
+        self.assertEqual([r.note_id for r in self.watcher.keyword_index.search("neural")], [])
+        self.assertEqual([r.note_id for r in self.watcher.keyword_index.search("sourdough")],
+                         [note_id])
+        self.assertEqual({r.note_id for r in self.watcher.vector_index.search("anything", k=10)},
+                         set(self.store.index))
+
+    def test_touch_without_change_is_not_reencoded(self):
+        """A new mtime with the same content only refreshes the stat."""
+        path = self.write('a.md', "same text")
+        self.watcher.sync()
+        calls = self.encoder.calls
+        os.utime(path, ns=(10 ** 18, 10 ** 18))
+        report = self.watcher.sync()
+        self.assertEqual(report.unchanged, 1)
+        self.assertEqual(self.encoder.calls, calls)
+        self.assertEqual(self.watcher.poll(), 0)
+
+    def test_unreadable_file_is_retried_not_deleted(self):
+        """A file that cannot be read for a while keeps its note."""
+        path = self.write('a.md', "locked note")
+        self.watcher.sync()
+        note_id = self.watcher.files[path].note_id
+        self.write('a.md', "locked note, edited", mtime_ns=10 ** 18)
+
+        real_open = open
+
+        def locked(file, *args, **kwargs):
+            if file == path:
+                raise PermissionError(13, "locked", file)
+            return real_open(file, *args, **kwargs)
+
+        with patch('builtins.open', side_effect=locked):
+            report = self.watcher.sync()
+        self.assertEqual(report.summary()['deleted'], 0)
+        self.assertIn(path, self.watcher.pending)
+        self.assertIn(note_id, self.store)
+
+        report = self.watcher.sync()
+        self.assertEqual(report.updated, [path])
+        self.assertEqual(self.watcher.files[path].note_id, note_id)
+        self.assertEqual(self.store.get(note_id).text, "locked note, edited")
+
+    def test_debounce_waits_for_quiet_files(self):
+        """Files are only ready once they stop changing."""
+        path = self.write('a.md', "draft", mtime_ns=1)
+        self.watcher.poll(now=100.0)
+        self.assertEqual(self.watcher.ready(now=100.2), [])
+        self.write('a.md', "second draft", mtime_ns=2)
+        self.watcher.poll(now=100.4)
+        self.assertEqual(self.watcher.ready(now=100.8), [])
+        self.assertEqual(self.watcher.ready(now=101.0), [path])
+
+        report = self.watcher.process(self.watcher.ready(now=101.0))
+        self.assertEqual(report.added, [path])
+        self.assertEqual(self.watcher.pending, {})
+
+    def test_state_survives_restart(self):
+        """A new watcher only processes what changed while it was stopped."""
+        self.write('a.md', "kept")
+        self.write('b.md', "edited later")
+        self.watcher.sync()
+        self.write('b.md', "edited while stopped", mtime_ns=10 ** 18)
+
+        report = self.make_watcher().sync()
+        self.assertEqual(len(report.added), 0)
+        self.assertEqual(len(report.updated), 1)
+        self.assertEqual(len(self.store), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Tests for shared-memory parallel encoding.
+"""
+
+import unittest
+from unittest.mock import patch
+from parallel_encoder import ParallelEncoder, split_pieces
+from test_support import StandInEncoding
+from token_manager import TokenManager
+
+
+BOOK = "".join(f"Chapter {i}\n  Indented line {i}, naïve café.\nPlain line {i}.\n\n"
+               for i in range(300))
+
+
+class TestSplitPieces(unittest.TestCase):
+    """Test cases for safe boundary splitting."""
+
+    def test_pieces_cover_text_and_end_at_safe_cuts(self):
+        data = BOOK.encode('utf-8')
+        pieces = split_pieces(data, 500)
+        self.assertGreater(len(pieces), 10)
+        self.assertEqual(b"".join(data[o:o + n] for o, n in pieces), data)
+        for offset, length in pieces[:-1]:
+            self.assertGreaterEqual(length, 500)
+            self.assertEqual(data[offset + length - 1:offset + length], b"\n")
+            self.assertFalse(data[offset + length:offset + length + 1].isspace())
+
+    def test_text_without_safe_cut_stays_whole(self):
+        self.assertEqual(split_pieces(b"x" * 100, 10), [(0, 100)])
+        self.assertEqual(split_pieces(b"", 10), [(0, 0)])
+
+
+class TestParallelEncoder(unittest.TestCase):
+    """Test cases for ParallelEncoder."""
+
+    @classmethod
+    def setUpClass(cls):
+        # Token ids are crc32s, so forked workers agree with the parent
+        cls.encoder = StandInEncoding(r" ?\w+| ?[^\w\s]+|\s+")
+        with patch('tiktoken.get_encoding', return_value=cls.encoder):
+            cls.token_mgr = TokenManager()
+            # Forked workers inherit the stand-in encoding
+            cls.parallel = ParallelEncoder(cls.token_mgr, processes=2, piece_bytes=4000,
+                                           min_piece_bytes=1000, start_method='fork')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.parallel.close()
+
+    def test_huge_document_matches_serial_encoding(self):
+        """Encoding split across workers equals encoding the whole text."""
+        expected = self.token_mgr.encode(BOOK)
+        tokens = self.parallel.encode(BOOK)
+        self.assertEqual(tokens.dtype.name, 'uint32')
+        self.assertEqual(tokens.tolist(), expected)
+        self.assertEqual(self.parallel.count_tokens(BOOK), len(expected))
+
+    def test_many_documents(self):
+        """Results come back per document and in order."""
+        texts = ["", "short note", BOOK, "café ✓ \U0001F600"]
+        counts = self.parallel.count_many(texts)
+        self.assertEqual(counts, [self.token_mgr.count_tokens(t) for t in texts])
+        encoded = self.parallel.encode_many(texts)
+        self.assertEqual([len(tokens) for tokens in encoded], counts)
+
+    def test_chunk_text(self):
+        """Chunks match chunking the serially encoded tokens."""
+        expected = self.token_mgr.chunk_tokens(self.token_mgr.encode(BOOK), 200)
+        self.assertEqual(self.parallel.chunk_text(BOOK, 200), expected)
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            ParallelEncoder(self.token_mgr, model='unknown')
+        with self.assertRaises(ValueError):
+            ParallelEncoder(self.token_mgr, piece_bytes=10, min_piece_bytes=20)
+
+
+if __name__ == '__main__':
+    unittest.main()
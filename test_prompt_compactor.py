@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Tests for lossless prompt compaction.
+"""
+
+import unittest
+from unittest.mock import patch
+from prompt_compactor import (PromptCompactor, collapse_markdown, normalize_whitespace,
+                              remove_repeats)
+from test_support import StandInEncoding
+from token_manager import TokenManager
+
+
+URL = "https://example.com/research/papers/2023/attention-is-all-you-need?ref=notes"
+
+PROMPT = f"""    # Study notes ##
+
+    Transformers   use **self-attention** to weigh tokens.
+    Source: {URL}
+
+
+    ---
+
+    Transformers   use **self-attention** to weigh tokens.
+
+    ```python
+    x  =  attention(q, k, v)   # keep  spacing  in code
+    ```
+    Read {URL} again.
+    <!-- draft comment -->
+"""
+
+
+class TestRewrites(unittest.TestCase):
+    """Test cases for the individual rewrite steps."""
+
+    def test_whitespace(self):
+        text = normalize_whitespace("  a  b   \n\n\n\n  c\t d\n")
+        self.assertEqual(text, "a b\n\nc d")
+
+    def test_code_fences_are_kept(self):
+        code = "```\nx  =  1\n\n\n**not bold**\n```"
+        self.assertEqual(collapse_markdown(remove_repeats(code)), code)
+        self.assertIn("x  =  1", normalize_whitespace("Intro  text\n" + code))
+
+    def test_repeats(self):
+        text = ("First paragraph here.\n\nA long line that is repeated twice\nshort\n\n"
+                "First paragraph here.\n\nA long line that is repeated twice\nshort\nnew")
+        self.assertEqual(remove_repeats(text, min_line_chars=20),
+                         "First paragraph here.\n\nA long line that is repeated twice\nshort\n\n"
+                         "short\nnew")
+
+    def test_markdown(self):
+        text = ("## Title ##\n\n***\n**bold** and `__init__`\n<!-- note -->\n"
+                "| a | b |\n| :---: | --- |\n")
+        self.assertEqual(collapse_markdown(text),
+                         "## Title\n\nbold and `__init__`\n\n| a | b |\n|-|-|\n")
+
+    def test_markdown_keeps_code_like_delimiters(self):
+        text = "Define __init__ and call obj.__repr__ here.\nCompute a**2 + b**2 = c**2."
+        self.assertEqual(collapse_markdown(text), text)
+        self.assertEqual(collapse_markdown("Say **very** and __really bold__ (**x**)."),
+                         "Say very and really bold (x).")
+
+
+class TestPromptCompactor(unittest.TestCase):
+    """Test cases for PromptCompactor and optimize_prompt."""
+
+    def setUp(self):
+        # Every character of a run of spaces is a token
+        self.encoder = StandInEncoding(r" ?\w+| ?[^\w\s]|\s")
+        with patch('tiktoken.get_encoding', return_value=self.encoder):
+            self.token_mgr = TokenManager()
+
+    def test_compaction_saves_tokens_and_is_reversible(self):
+        """Each kept step saves tokens and placeholders expand back."""
+        result = self.token_mgr.compact_prompt(PROMPT)
+        self.assertEqual(result.original_tokens, self.token_mgr.count_tokens(PROMPT))
+        self.assertEqual(result.token_count, self.token_mgr.count_tokens(result.text))
+        self.assertEqual([name for name, _ in result.steps],
+                         ['whitespace', 'repeats', 'markdown', 'references'])
+        self.assertTrue(all(saved > 0 for _, saved in result.steps))
+        self.assertEqual(sum(saved for _, saved in result.steps), result.tokens_saved)
+
+        self.assertEqual(result.text.count("Transformers use self-attention"), 1)
+        self.assertIn("x  =  attention(q, k, v)", result.text)
+        self.assertNotIn(URL, result.text)
+        self.assertEqual(result.expand("See [URL1]."), f"See {URL}.")
+
+    def test_stops_once_target_is_met(self):
+        """Later steps are skipped when earlier ones are enough."""
+        whitespace_only = self.token_mgr.compact_prompt(PROMPT, steps=['whitespace'])
+        result = self.token_mgr.compact_prompt(PROMPT, whitespace_only.token_count)
+        self.assertEqual([name for name, _ in result.steps], ['whitespace'])
+
+    def test_unchanged_segments_are_not_reencoded(self):
+        """Measuring a step only encodes the segments it changed."""
+        compactor = PromptCompactor(self.token_mgr, steps=['references'])
+        body = "\n".join(f"Line {i} of a long note." for i in range(400))
+        prompt = body + f"\nSee {URL}\n"
+        compactor.count(prompt)
+        self.encoder.encoded = 0
+        compactor.compact(prompt)
+        self.assertLess(self.encoder.encoded, len(prompt) / 2)
+
+    def test_optimize_prompt_compacts_before_truncating(self):
+        """Prompts that fit after compaction keep all of their words."""
+        prompt = "Keep   every   word   here.\n\n\n\nKeep   every   word   here."
+        compacted = self.token_mgr.optimize_prompt(prompt, 6)
+        self.assertEqual(compacted, "Keep every word here.")
+
+        truncated = self.token_mgr.optimize_prompt(prompt, 3)
+        self.assertEqual(truncated, "Keep every word")
+
+    def test_unknown_step(self):
+        with self.assertRaises(ValueError):
+            PromptCompactor(self.token_mgr, steps=['magic'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Tests for precompiled prompt templates.
+"""
+
+import unittest
+from unittest.mock import patch
+from test_support import StandInEncoding
+from token_manager import TokenManager
+
+# Glues a newline onto the following word
+MERGING = r"\n\w+|\w+|[^\w\s]|\s+"
+
+
+class ByteEncoder:
+    """Byte-level encoding: one token per UTF-8 byte."""
+
+    def encode(self, text):
+        return list(text.encode('utf-8'))
+
+    def decode(self, tokens):
+        return bytes(tokens).decode('utf-8', 'replace')
+
+
+TEMPLATE = ("You are a careful study assistant.\n"
+            "Follow these rules:\n"
+            "- Use bullet points.\n"
+            "- Never invent facts.\n\n"
+            "Note:\n{note}\n\n"
+            "Question: {question}\n"
+            "Answer in {style} style.\n"
+            "End of instructions.")
+
+
+class TestPromptTemplate(unittest.TestCase):
+    """Test cases for PromptTemplate."""
+
+    def make_manager(self, encoder):
+        with patch('tiktoken.get_encoding', return_value=encoder):
+            return TokenManager()
+
+    def setUp(self):
+        self.encoder = StandInEncoding()
+        self.token_mgr = self.make_manager(self.encoder)
+
+    def test_render_count_is_exact(self):
+        """Rendered counts equal counting the whole rendered text."""
+        template = self.token_mgr.compile_template(TEMPLATE)
+        self.assertGreater(template.static_tokens, 0)
+        for note, question, style in [("Short note.", "Why?", "terse"),
+                                      ("Line one\nline two\n  indented", "How, exactly?", ""),
+                                      ("", "", "formal")]:
+            rendered = template.render(note=note, question=question, style=style)
+            self.assertEqual(rendered.text, TEMPLATE.format(note=note, question=question,
+                                                            style=style))
+            self.assertEqual(rendered.token_count, self.token_mgr.count_tokens(rendered.text))
+
+    def test_render_only_encodes_values_and_edges(self):
+        """Rendering encodes far less than the full prompt."""
+        template = self.token_mgr.compile_template(TEMPLATE)
+        note = "word " * 200
+        self.encoder.encoded = 0
+        rendered = template.render(note=note, question="What?", style="plain")
+        self.assertLess(self.encoder.encoded, len(rendered.text))
+
+    def test_values_truncated_to_budget(self):
+        """Slot values over budget are cut and reported."""
+        template = self.token_mgr.compile_template(TEMPLATE, budgets={'note': 10})
+        rendered = template.render(note="alpha beta gamma delta epsilon zeta eta theta",
+                                   question="What?", style="plain")
+        self.assertIn('note', rendered.truncated)
+        self.assertIn("alpha beta", rendered.text)
+        self.assertNotIn("theta", rendered.text)
+        self.assertEqual(rendered.token_count, self.token_mgr.count_tokens(rendered.text))
+
+    def test_multibyte_values_truncated_to_budget(self):
+        """Values with fewer characters than the budget can still need more tokens."""
+        token_mgr = self.make_manager(ByteEncoder())
+        template = token_mgr.compile_template(TEMPLATE, budgets={'note': 10})
+        rendered = template.render(note="é" * 10, question="Why?", style="plain")
+        self.assertEqual(rendered.truncated, {'note': 10})
+        self.assertIn("\n" + "é" * 5 + "\n", rendered.text)
+        self.assertEqual(rendered.token_count, token_mgr.count_tokens(rendered.text))
+
+    def test_remaining_budget_is_shared(self):
+        """Slots without explicit budgets share what the window leaves."""
+        template = self.token_mgr.compile_template(TEMPLATE, max_tokens=200, budgets={'style': 5})
+        self.assertEqual(template.slots['style'].budget, 5)
+        self.assertEqual(template.slots['note'].budget, template.slots['question'].budget)
+        rendered = template.render(note="x " * 500, question="y " * 500, style="z")
+        self.assertLessEqual(rendered.token_count, 200)
+
+    def test_merging_encoder_stays_exact(self):
+        """Static cuts an encoder merges across are not pre-counted."""
+        token_mgr = self.make_manager(StandInEncoding(MERGING))
+        template = token_mgr.compile_template(TEMPLATE)
+        rendered = template.render(note="Some note", question="Why?", style="short")
+        self.assertEqual(rendered.token_count, token_mgr.count_tokens(rendered.text))
+
+    def test_invalid_templates(self):
+        """Bad fields, missing values and impossible budgets are rejected."""
+        with self.assertRaises(ValueError):
+            self.token_mgr.compile_template("Value: {0}")
+        with self.assertRaises(ValueError):
+            self.token_mgr.compile_template("Value: {note:>10}")
+        with self.assertRaises(ValueError):
+            self.token_mgr.compile_template(TEMPLATE, budgets={'missing': 3})
+        with self.assertRaises(ValueError):
+            self.token_mgr.compile_template(TEMPLATE, max_tokens=5)
+        with self.assertRaises(ValueError):
+            self.token_mgr.compile_template(TEMPLATE).render(note="only one")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Tests for the model response cache.
+"""
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from model_client import LocalModelClient
+from response_cache import CachedClient, ResponseCache
+from summarizer import Summarizer, SummaryCache
+from test_support import SPACED, StandInEncoding
+from token_manager import TokenManager
+
+NOTE = " ".join(f"Fact {i} about transformers and attention head {i * 7}." for i in range(60))
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestResponseCache(unittest.TestCase):
+    """Test cases for ResponseCache and CachedClient."""
+
+    def setUp(self):
+        with patch('tiktoken.get_encoding', return_value=StandInEncoding(SPACED)):
+            self.token_mgr = TokenManager()
+        self.clock = Clock()
+        self.backend = LocalModelClient(self.token_mgr)
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def make_client(self, **kwargs):
+        cache = ResponseCache(self.token_mgr, clock=self.clock, **kwargs)
+        return CachedClient(self.backend, cache)
+
+    def test_exact_hit_reports_savings(self):
+        """Whitespace-only differences hit; sampling params are part of the key."""
+        client = self.make_client()
+        hits = []
+        client.on_hit = hits.append
+        prompt = "Summarize:\n\n" + NOTE
+        first = client.complete(prompt, 'gpt-4', 50)
+        again = client.complete("  Summarize:\r\n\n" + NOTE.replace(" ", "   ") + "\n", 'gpt-4', 50)
+        self.assertEqual(len(self.backend.calls), 1)
+        self.assertTrue(again.cached)
+        self.assertEqual(again.text, first.text)
+
+        self.assertEqual(len(hits), 1)
+        expected = first.input_tokens * 0.03 / 1000 + first.output_tokens * 0.06 / 1000
+        self.assertAlmostEqual(hits[0].cost_saved, expected)
+        self.assertEqual(hits[0].tokens_saved, first.input_tokens + first.output_tokens)
+        self.assertAlmostEqual(client.cache.stats['cost_saved'], expected)
+
+        client.complete(prompt, 'gpt-4', 50, temperature=0.9)
+        client.complete(prompt, 'gpt-4', 60)
+        client.complete(prompt, 'gpt-3.5-turbo', 50)
+        self.assertEqual(len(self.backend.calls), 4)
+
+    def test_near_duplicate_lookup(self):
+        """Prompts that differ by a word match when near-duplicate lookup is on."""
+        prompt = "Summarize:\n\n" + NOTE
+        edited = prompt.replace("Fact 29 ", "Fact twenty-nine ")
+        different = "Summarize:\n\n" + " ".join(f"Recipe {i} for bread." for i in range(40))
+
+        exact_only = self.make_client()
+        exact_only.complete(prompt, 'gpt-4', 50)
+        exact_only.complete(edited, 'gpt-4', 50)
+        self.assertEqual(len(self.backend.calls), 2)
+
+        client = self.make_client(near_duplicates=True)
+        client.complete(prompt, 'gpt-4', 50)
+        hit = client.cache.get(edited, 'gpt-4', 50)
+        self.assertIsNotNone(hit)
+        self.assertGreaterEqual(hit.similarity, 0.9)
+        self.assertLess(hit.similarity, 1.0)
+        self.assertIsNone(client.cache.get(different, 'gpt-4', 50))
+        self.assertIsNone(client.cache.get(edited, 'gpt-4', 50, top_p=0.5))
+        self.assertEqual(client.cache.stats['near_hits'], 1)
+
+    def test_ttl(self):
+        """Entries expire after their TTL."""
+        client = self.make_client(ttl=60)
+        client.complete("Explain attention.", 'gpt-4', 20)
+        self.clock.now += 30
+        client.complete("Explain attention.", 'gpt-4', 20)
+        self.clock.now += 31
+        client.complete("Explain attention.", 'gpt-4', 20)
+        self.assertEqual(len(self.backend.calls), 2)
+        self.assertEqual(client.cache.stats['expired'], 1)
+
+    def test_eviction_is_size_and_token_weighted(self):
+        """Among old entries, the one saving fewest tokens per byte goes first."""
+        cache = ResponseCache(self.token_mgr, max_entries=3, eviction_sample=2, clock=self.clock)
+        client = CachedClient(self.backend, cache)
+        long_reply = LocalModelClient(self.token_mgr, respond=lambda p, n: "x" * 2000)
+        CachedClient(long_reply, cache).complete("cheap to keep?", 'gpt-4', 10)
+        client.complete("Short prompt one here.", 'gpt-4', 10)
+        client.complete("Short prompt two here.", 'gpt-4', 10)
+        client.complete("Short prompt three here.", 'gpt-4', 10)
+
+        self.assertEqual(len(cache), 3)
+        self.assertIsNone(cache.get("cheap to keep?", 'gpt-4', 10))
+        self.assertIsNotNone(cache.get("Short prompt one here.", 'gpt-4', 10))
+
+        small = ResponseCache(self.token_mgr, max_bytes=300, clock=self.clock)
+        CachedClient(self.backend, small).complete(NOTE, 'gpt-4', 100)
+        self.assertEqual(len(small), 0)
+
+    def test_persistence(self):
+        """Saved caches are reloaded, including near-duplicate signatures."""
+        path = os.path.join(self.tmp.name, 'responses.json')
+        client = self.make_client(path=path, near_duplicates=True)
+        client.complete(NOTE, 'gpt-4', 30)
+        client.close()
+
+        reloaded = ResponseCache(self.token_mgr, path, near_duplicates=True, clock=self.clock)
+        self.assertEqual(len(reloaded), 1)
+        self.assertIsNotNone(reloaded.get(NOTE.replace("Fact 3 ", "Fact three "), 'gpt-4', 30))
+
+    def test_summarizer_counts_cached_responses(self):
+        """Cached responses are reported as cache hits that cost nothing."""
+        client = self.make_client()
+        Summarizer(self.token_mgr, client).summarize(NOTE)
+        result = Summarizer(self.token_mgr, client).summarize(NOTE)
+        self.assertEqual(len(self.backend.calls), 1)
+        self.assertEqual(result.cache_hits, 1)
+        self.assertEqual(result.total_cost, 0)
+
+    def test_budget_excludes_cached_responses(self):
+        """Prompts the response cache answers are not priced against max_cost."""
+        client = self.make_client()
+        Summarizer(self.token_mgr, client).summarize(NOTE)
+        result = Summarizer(self.token_mgr, client, max_cost=0.0).summarize(NOTE)
+        self.assertEqual(len(self.backend.calls), 1)
+        self.assertEqual(result.cache_hits, 1)
+        self.assertEqual(client.cache.stats['hits'], 1)
+
+    def test_near_duplicate_summaries_are_not_stored_as_exact(self):
+        """A summary answered for a similar prompt is not cached under the new prompt."""
+        summaries = SummaryCache(self.tmp.name)
+        client = self.make_client(near_duplicates=True)
+        Summarizer(self.token_mgr, client, cache=summaries).summarize(NOTE)
+        edited = NOTE.replace("Fact 29 ", "Fact twenty-nine ")
+        result = Summarizer(self.token_mgr, client, cache=summaries).summarize(edited)
+        self.assertEqual(result.cache_hits, 1)
+        self.assertEqual(len(self.backend.calls), 1)
+
+        Summarizer(self.token_mgr, self.backend, cache=SummaryCache(self.tmp.name)).summarize(edited)
+        self.assertEqual(len(self.backend.calls), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Tests for the rate-limited request scheduler, run against a local
+stand-in for an OpenAI-compatible server.
+"""
+
+import asyncio
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from model_client import LocalModelClient, OpenAIModelClient
+from scheduler import (RequestScheduler, ScheduledClient, TokenBucket,
+                       build_batch_prompt, split_batch_response)
+from test_support import SPLIT, StandInEncoding
+from token_manager import TokenManager
+
+
+class StandInServer:
+    """Chat completions server that answers 429 when its limits are exceeded."""
+
+    def __init__(self, requests_per_period, tokens_per_period, period):
+        self.rates = (requests_per_period / period, tokens_per_period / period)
+        self.capacity = [requests_per_period, tokens_per_period]
+        self.available = list(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.prompts = []
+        self.rejected = 0
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                prompt = body['messages'][0]['content']
+                if not server.admit(len(prompt.split()) + body['max_tokens']):
+                    self.send_response(429)
+                    self.send_header('Retry-After', '0.05')
+                    self.end_headers()
+                    return
+                server.prompts.append(prompt)
+                text = server.answer(prompt)
+                self.reply({
+                    'choices': [{'message': {'content': text}}],
+                    'usage': {'prompt_tokens': len(prompt.split()),
+                              'completion_tokens': len(text.split())}
+                })
+
+            def reply(self, data):
+                payload = json.dumps(data).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1/chat/completions"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def admit(self, tokens):
+        with self.lock:
+            now = time.monotonic()
+            for i, rate in enumerate(self.rates):
+                self.available[i] = min(self.capacity[i],
+                                        self.available[i] + (now - self.updated) * rate)
+            self.updated = now
+            # Tolerate the few milliseconds between admission and arrival
+            if self.available[0] < 1 - 0.05 * self.capacity[0] or \
+                    self.available[1] < tokens - 0.05 * self.capacity[1]:
+                self.rejected += 1
+                return False
+            self.available[0] -= 1
+            self.available[1] -= tokens
+            return True
+
+    @staticmethod
+    def answer(prompt):
+        if "### Task 1" not in prompt:
+            return "answer: " + " ".join(prompt.split()[:3])
+        tasks = prompt.split("### Task ")[1:]
+        return "\n".join(f"### Task {task.split()[0]}\nanswer: {' '.join(task.split()[1:4])}"
+                         for task in tasks)
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class TestScheduler(unittest.TestCase):
+    """Test cases for RequestScheduler."""
+
+    def setUp(self):
+        """Set up a token manager that counts words as tokens."""
+        with patch('tiktoken.get_encoding', return_value=StandInEncoding(SPLIT)):
+            self.token_mgr = TokenManager()
+
+    def run_requests(self, server, prompts, max_tokens, limits, **kwargs):
+        client = OpenAIModelClient(api_key='test', api_url=server.url)
+
+        async def go():
+            async with RequestScheduler(self.token_mgr, client, limits=limits,
+                                        period=0.5, **kwargs) as scheduler:
+                results = await scheduler.complete_many(prompts, max_tokens=max_tokens)
+            return results, scheduler.stats
+
+        return asyncio.run(go())
+
+    def test_batch_prompt_round_trip(self):
+        """Batched replies split back into per-task answers."""
+        prompt = build_batch_prompt(["first", "second"])
+        self.assertIn("### Task 2\nsecond", prompt)
+        reply = "### Task 2\nB\n### Task 1\nA"
+        self.assertEqual(split_batch_response(reply, 2), ["A", "B"])
+        self.assertIsNone(split_batch_response("### Task 1\nA", 2))
+
+    def test_small_requests_are_coalesced(self):
+        """Small requests arriving together share one call."""
+        server = StandInServer(100, 10000, 0.5)
+        self.addCleanup(server.close)
+        prompts = [f"question {i} about notes" for i in range(6)]
+        limits = {'default': {'requests_per_minute': 100, 'tokens_per_minute': 10000}}
+
+        results, stats = self.run_requests(server, prompts, 10, limits)
+        self.assertEqual(len(server.prompts), 1)
+        self.assertEqual(stats['coalesced'], 6)
+        for i, completion in enumerate(results):
+            self.assertEqual(completion.text, f"answer: question {i} about")
+
+    def test_token_limit_is_respected(self):
+        """Large requests are spread out so the server never throttles."""
+        server = StandInServer(100, 100, 0.5)
+        self.addCleanup(server.close)
+        prompts = [" ".join(["word"] * 30) for _ in range(8)]
+        limits = {'default': {'requests_per_minute': 100, 'tokens_per_minute': 100}}
+
+        start = time.monotonic()
+        results, stats = self.run_requests(server, prompts, 10, limits, coalesce_max_tokens=20)
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(len(results), 8)
+        self.assertEqual(server.rejected, 0)
+        self.assertEqual(stats['retries'], 0)
+        # 8 * 40 tokens minus the initial burst of 100, refilled at 200 per second
+        self.assertGreaterEqual(elapsed, 1.0)
+
+    def test_rate_limit_responses_are_retried(self):
+        """Calls rejected by a stricter server are retried and succeed."""
+        server = StandInServer(2, 10000, 0.5)
+        self.addCleanup(server.close)
+        prompts = [" ".join(["word"] * 30) for _ in range(5)]
+        limits = {'default': {'requests_per_minute': 100, 'tokens_per_minute': 10000}}
+
+        results, stats = self.run_requests(server, prompts, 10, limits,
+                                           coalesce_max_tokens=20, max_retries=20)
+        self.assertEqual(len(results), 5)
+        self.assertGreater(stats['retries'], 0)
+
+    def test_unmarked_batch_reply_falls_back(self):
+        """If a batched reply loses its markers each request is sent alone."""
+        client = LocalModelClient(self.token_mgr)
+
+        async def go():
+            async with RequestScheduler(self.token_mgr, client) as scheduler:
+                return await scheduler.complete_many(["alpha beta", "gamma delta"],
+                                                     max_tokens=5)
+
+        results = asyncio.run(go())
+        self.assertEqual(len(client.calls), 3)
+        self.assertEqual([r.text for r in results], ["alpha beta", "gamma delta"])
+
+    def test_oversized_request_fails(self):
+        """A request heavier than the token limit can never run."""
+        client = LocalModelClient(self.token_mgr)
+        limits = {'default': {'requests_per_minute': 10, 'tokens_per_minute': 10}}
+
+        async def go():
+            async with RequestScheduler(self.token_mgr, client, limits=limits) as scheduler:
+                await scheduler.submit("far too long", max_tokens=50)
+
+        with self.assertRaises(ValueError):
+            asyncio.run(go())
+
+    def test_close_fails_requests_not_yet_admitted(self):
+        """Closing resolves queued requests and the one waiting for a bucket."""
+        client = LocalModelClient(self.token_mgr)
+        limits = {'default': {'requests_per_minute': 1, 'tokens_per_minute': 1000}}
+
+        async def go():
+            scheduler = RequestScheduler(self.token_mgr, client, limits=limits,
+                                         coalesce_max_tokens=0)
+            tasks = [asyncio.ensure_future(scheduler.submit(f"note {i}", max_tokens=5))
+                     for i in range(3)]
+            await asyncio.wait_for(asyncio.shield(tasks[0]), 5)
+            await asyncio.sleep(0.05)
+            await asyncio.wait_for(scheduler.close(), 5)
+            return await asyncio.gather(*tasks, return_exceptions=True)
+
+        results = asyncio.run(go())
+        self.assertEqual(results[0].text, "note 0")
+        self.assertTrue(all(isinstance(r, RuntimeError) for r in results[1:]))
+        self.assertEqual(len(client.calls), 1)
+
+    def test_scheduled_client_from_threads(self):
+        """Threaded callers share one scheduler through ScheduledClient."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        server = StandInServer(100, 10000, 0.5)
+        self.addCleanup(server.close)
+        client = ScheduledClient(RequestScheduler(
+            self.token_mgr, OpenAIModelClient(api_key='test', api_url=server.url), period=0.5))
+        try:
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                results = list(pool.map(
+                    lambda i: client.complete(f"note {i} text", 'gpt-3.5-turbo', 5), range(4)))
+        finally:
+            client.close()
+
+        self.assertEqual([r.text for r in results], [f"answer: note {i} text" for i in range(4)])
+        self.assertLess(len(server.prompts), 4)
+
+    def test_token_bucket_waits_for_refill(self):
+        """Acquiring more than is available waits for the refill."""
+        bucket = TokenBucket(10, period=0.2)
+
+        async def go():
+            await bucket.acquire(10)
+            start = time.monotonic()
+            await bucket.acquire(5)
+            return time.monotonic() - start
+
+        self.assertGreaterEqual(asyncio.run(go()), 0.08)
+
+
+if __name__ == '__main__':
+    unittest.main()
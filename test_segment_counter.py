@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Tests for deduplicated token counting.
+"""
+
+import unittest
+from unittest.mock import patch
+from test_support import StandInEncoding
+from token_manager import TokenManager
+
+# Glues a newline onto the following word
+MERGING = r"\n\w+|\w+|[^\w\s]|\s+"
+
+
+def make_document(body_lines):
+    header = [f"# Template header line {i}\n" for i in range(40)]
+    footer = [f"Reference {i}: see the shared appendix.\n" for i in range(40)]
+    return "".join(header + body_lines + footer)
+
+
+class TestSegmentCounter(unittest.TestCase):
+    """Test cases for SegmentCounter."""
+
+    def setUp(self):
+        """Set up a token manager with a deterministic encoder."""
+        with patch('tiktoken.get_encoding', return_value=StandInEncoding()):
+            self.token_mgr = TokenManager()
+        self.counter = self.token_mgr.segment_counter
+
+    def test_segments_join_back(self):
+        """Segments must concatenate to the original text."""
+        text = make_document([f"Body line {i}\n" for i in range(100)])
+        segments = self.counter.split_segments(text)
+        self.assertGreater(len(segments), 1)
+        self.assertEqual("".join(segments), text)
+
+    def test_cuts_only_before_unindented_lines(self):
+        """No segment may start with whitespace or end without a newline."""
+        text = "".join(f"item {i}\n    detail {i}\n" for i in range(200))
+        segments = self.counter.split_segments(text)
+        for segment in segments[1:]:
+            self.assertFalse(segment[0].isspace())
+        for segment in segments[:-1]:
+            self.assertTrue(segment.endswith('\n'))
+
+    def test_dedup_count_is_exact(self):
+        """Deduplicated counts equal plain counts."""
+        for body in (["short\n"], [f"Body line {i}.\n" for i in range(300)], []):
+            text = make_document(body)
+            self.assertEqual(self.token_mgr.count_tokens(text, dedup=True),
+                             self.token_mgr.count_tokens(text))
+
+    def test_empty_and_single_line(self):
+        """Texts without cut points are counted directly."""
+        self.assertEqual(self.token_mgr.count_tokens("", dedup=True), 0)
+        self.assertEqual(self.token_mgr.count_tokens("one line only", dedup=True),
+                         self.token_mgr.count_tokens("one line only"))
+
+    def test_shared_segments_are_reused(self):
+        """Boilerplate shared across documents is encoded once."""
+        first = make_document([f"First note {i}\n" for i in range(10)])
+        second = make_document([f"Second note {i}\n" for i in range(10)])
+        self.counter.count_corpus([first, second])
+
+        stats = self.counter.get_stats()
+        self.assertGreater(stats['hits'], 0)
+        self.assertLess(stats['segments'], len(self.counter.split_segments(first)) * 2)
+
+    def test_small_edit_recounts_few_segments(self):
+        """Editing one line only misses the segments around the edit."""
+        lines = [f"Paragraph line {i}\n" for i in range(400)]
+        self.token_mgr.count_tokens("".join(lines), dedup=True)
+        misses = self.counter.misses
+
+        lines[200] = "An edited line in the middle\n"
+        edited = "".join(lines)
+        self.assertEqual(self.token_mgr.count_tokens(edited, dedup=True),
+                         self.token_mgr.count_tokens(edited))
+        self.assertLessEqual(self.counter.misses - misses, 3)
+
+    def test_junction_correction(self):
+        """Totals stay exact for encoders that merge across a cut."""
+        with patch('tiktoken.get_encoding', return_value=StandInEncoding(MERGING)):
+            token_mgr = TokenManager()
+        text = make_document([f"Body line {i}\n" for i in range(100)])
+        self.assertGreater(len(token_mgr.segment_counter.split_segments(text)), 1)
+        self.assertEqual(token_mgr.count_tokens(text, dedup=True),
+                         token_mgr.count_tokens(text))
+
+    def test_clean_cut_encodings_skip_correction(self):
+        """Encodings known not to merge across cuts need no junction encodes."""
+        encoding = StandInEncoding()
+        encoding.name = 'cl100k_base'
+        with patch('tiktoken.get_encoding', return_value=encoding):
+            token_mgr = TokenManager()
+        text = make_document([f"Body line {i}\n" for i in range(100)])
+        self.assertEqual(token_mgr.count_tokens(text, dedup=True),
+                         token_mgr.count_tokens(text))
+        self.assertEqual(token_mgr.segment_counter.get_stats()['junctions'], 0)
+
+    def test_table_is_bounded(self):
+        """The segment table evicts old entries beyond its size."""
+        self.counter.table_size = 5
+        self.counter.count_tokens("".join(f"Unique line {i}\n" for i in range(500)))
+        self.assertLessEqual(len(self.counter.segments), 5)
+
+    def test_invalid_average(self):
+        """The average segment length must be a power of two."""
+        from segment_counter import SegmentCounter
+        with self.assertRaises(ValueError):
+            SegmentCounter(self.token_mgr, avg_segment_lines=10)
+
+
+if __name__ == '__main__':
+    unittest.main()
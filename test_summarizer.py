@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Tests for the map-reduce summarization pipeline.
+"""
+
+import tempfile
+import unittest
+from unittest.mock import patch
+from model_client import LocalModelClient
+from summarizer import MAP_INSTRUCTION, Summarizer, SummaryCache
+from test_support import SPACED, StandInEncoding
+from token_manager import TokenManager
+
+
+def make_text(sentences):
+    return " ".join(f"Sentence number {i} talks about topic {i % 5}." for i in range(sentences))
+
+
+class TestSummarizer(unittest.TestCase):
+    """Test cases for Summarizer."""
+
+    def setUp(self):
+        """Set up a token manager that counts words as tokens."""
+        with patch('tiktoken.get_encoding', return_value=StandInEncoding(SPACED)):
+            self.token_mgr = TokenManager()
+        self.token_mgr.models['gpt-3.5-turbo']['context_window'] = 120
+        self.client = LocalModelClient(self.token_mgr)
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def make_summarizer(self, **kwargs):
+        return Summarizer(self.token_mgr, self.client,
+                          cache=SummaryCache(self.tmp.name), summary_tokens=20, **kwargs)
+
+    def test_short_text_single_call(self):
+        """A text that fits one chunk needs a single map call."""
+        result = self.make_summarizer().summarize("Neural networks mimic neurons.")
+        self.assertEqual(result.chunk_count, 1)
+        self.assertEqual(len(self.client.calls), 1)
+        self.assertEqual([stage.name for stage in result.stages], ['map'])
+        self.assertIn("Neural networks", result.summary)
+
+    def test_hierarchical_reduce_fits_window(self):
+        """Long texts are reduced over several levels to one summary."""
+        summarizer = self.make_summarizer()
+        result = summarizer.summarize(make_text(200))
+
+        self.assertGreater(result.chunk_count, 10)
+        self.assertGreater(len(result.stages), 2)
+        self.assertEqual(result.stages[0].calls, result.chunk_count)
+        for call in self.client.calls:
+            tokens = self.token_mgr.count_tokens(call['prompt'])
+            self.assertLessEqual(tokens + call['max_tokens'], 120)
+        self.assertLessEqual(self.token_mgr.count_tokens(result.summary), 20)
+
+    def test_unpunctuated_text_is_chunked_by_tokens(self):
+        """A long run without sentence ends is still cut to fit the window."""
+        text = " ".join(f"word{i}" for i in range(500))
+        summarizer = self.make_summarizer()
+        result = summarizer.summarize(text)
+
+        self.assertGreater(result.chunk_count, 5)
+        for call in self.client.calls:
+            tokens = self.token_mgr.count_tokens(call['prompt'])
+            self.assertLessEqual(tokens + call['max_tokens'], 120)
+
+        calls = len(self.client.calls)
+        with self.assertRaises(ValueError):
+            summarizer._run_stage('map', MAP_INSTRUCTION, [text], [])
+        self.assertEqual(len(self.client.calls), calls)
+
+    def test_edit_only_redoes_changed_chunks(self):
+        """Unchanged chunks come from the on-disk cache."""
+        text = make_text(100)
+        first = self.make_summarizer().summarize(text)
+        map_calls = first.stages[0].calls
+
+        edited = text.replace("Sentence number 99 talks", "Sentence number 99 speaks")
+        second = self.make_summarizer().summarize(edited)
+        self.assertEqual(second.stages[0].calls, 1)
+        self.assertEqual(second.stages[0].cache_hits, map_calls - 1)
+        self.assertLess(second.total_cost, first.total_cost)
+
+    def test_costs_use_model_prices(self):
+        """Stage costs are computed from the registry prices."""
+        result = self.make_summarizer().summarize("Short note.")
+        stage = result.stages[0]
+        price = self.token_mgr.models['gpt-3.5-turbo']
+        expected = stage.input_tokens / 1000 * price['input_cost_per_1k'] + \
+            stage.output_tokens / 1000 * price['output_cost_per_1k']
+        self.assertAlmostEqual(result.total_cost, expected)
+
+    def test_budget_exceeded(self):
+        """A stage that would exceed max_cost is not run."""
+        with self.assertRaises(ValueError):
+            self.make_summarizer(max_cost=0.0).summarize(make_text(50))
+        self.assertEqual(self.client.calls, [])
+
+    def test_invalid_configuration(self):
+        """Unknown models and oversized replies are rejected."""
+        with self.assertRaises(ValueError):
+            Summarizer(self.token_mgr, self.client, model='unknown')
+        with self.assertRaises(ValueError):
+            Summarizer(self.token_mgr, self.client, summary_tokens=500)
+
+
+if __name__ == '__main__':
+    unittest.main()
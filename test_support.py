@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Shared helpers for the tests.
+"""
+
+import re
+import zlib
+
+# Words, punctuation marks and runs of whitespace
+WORDS = r"\w+|[^\w\s]|\s+"
+# Whitespace-separated words, as str.split() would return them
+SPLIT = r"\S+"
+# The same words with the whitespace around them, so decode restores the text
+SPACED = r"\s*\S+\s*"
+
+
+class StandInEncoding:
+    """Stand-in for a tiktoken encoding that splits text with a regex.
+
+    Each piece's token is its crc32, so ids are stable across instances
+    and processes, and decode works for every piece encoded so far.
+    calls and encoded count encode calls and the characters encoded.
+    """
+
+    def __init__(self, pattern: str = WORDS):
+        self.pattern = re.compile(pattern)
+        self.pieces = {}
+        self.calls = 0
+        self.encoded = 0
+
+    def encode(self, text):
+        self.calls += 1
+        self.encoded += len(text)
+        tokens = []
+        for piece in self.pattern.findall(text):
+            token = zlib.crc32(piece.encode('utf-8', 'surrogatepass'))
+            self.pieces[token] = piece
+            tokens.append(token)
+        return tokens
+
+    def decode(self, tokens):
+        return "".join(self.pieces[int(token)] for token in tokens)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Tests for the persistent encoded-document store.
+"""
+
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+from test_support import StandInEncoding
+from token_manager import TokenManager
+from token_store import TokenStore
+
+
+NOTE = " ".join(f"Sentence {i} is about neural networks." for i in range(40))
+
+
+class ByteEncoding:
+    """Stand-in encoding with one token per UTF-8 byte."""
+
+    def encode(self, text):
+        return list(text.encode('utf-8'))
+
+    def decode(self, tokens):
+        return bytes(tokens).decode('utf-8', 'replace')
+
+
+class TestTokenStore(unittest.TestCase):
+    """Test cases for TokenStore."""
+
+    def setUp(self):
+        self.encoder = StandInEncoding(r" ?\w+| ?[^\w\s]|\s+")
+        with patch('tiktoken.get_encoding', return_value=self.encoder):
+            self.token_mgr = TokenManager()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = TokenStore(self.tmp.name, self.token_mgr)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_put_and_reload(self):
+        """Stored tokens survive reopening and decode to the note."""
+        tokens = self.store.put(1, NOTE)
+        self.store.put(2, "Second note.")
+
+        reopened = TokenStore(self.tmp.name, self.token_mgr)
+        stored = reopened.get(1)
+        self.assertEqual(stored.dtype, np.uint32)
+        self.assertEqual(stored.tolist(), list(tokens))
+        self.assertEqual(self.encoder.decode(stored.tolist()), NOTE)
+        self.assertEqual(reopened.count_tokens(2), 3)
+        self.assertIsNone(reopened.get(3))
+
+    def test_unchanged_note_is_not_reencoded(self):
+        """Matching content hashes skip encoding; edits re-encode."""
+        self.store.put(1, NOTE)
+        calls = self.encoder.calls
+        self.store.get(1, NOTE)
+        self.assertEqual(self.encoder.calls, calls)
+
+        edited = self.store.get(1, NOTE + " One more.")
+        self.assertEqual(self.encoder.calls, calls + 1)
+        self.assertEqual(TokenStore(self.tmp.name, self.token_mgr).get(1).tolist(),
+                         edited.tolist())
+
+    def test_operations_do_not_encode(self):
+        """Chunking, truncation and context checks use stored tokens."""
+        self.store.put(1, NOTE)
+        calls = self.encoder.calls
+
+        chunks = self.store.chunk_text(1, 50)
+        check = self.store.check_context_limit(1)
+        self.assertEqual(self.encoder.calls, calls)
+
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(chunk.endswith('.') for chunk in chunks[:-1]))
+        self.assertEqual(" ".join(chunks), NOTE)
+        self.assertEqual(check['token_count'], len(self.store.get(1)))
+
+        truncated = self.store.optimize_prompt(1, 20)
+        whole = self.store.optimize_prompt(1, 10 ** 6)
+        self.assertEqual(self.encoder.calls, calls)
+
+        self.assertTrue(NOTE.startswith(truncated))
+        self.assertLessEqual(self.token_mgr.count_tokens(truncated), 20)
+        self.assertEqual(whole, NOTE)
+
+    def test_truncation_keeps_line_breaks(self):
+        """Truncating stored tokens keeps the prefix as written."""
+        text = "First line here.\n\nSecond line here.\nThird line is longer than the rest."
+        self.store.put(1, text)
+        self.assertEqual(self.store.optimize_prompt(1, 12),
+                         "First line here.\n\nSecond line here.\nThird line")
+
+    def test_chunks_do_not_split_characters(self):
+        """Chunk cuts move back to the start of a multi-byte character."""
+        with patch('tiktoken.get_encoding', return_value=ByteEncoding()):
+            token_mgr = TokenManager()
+        text = "日本語のノート" * 20
+        chunks = token_mgr.chunk_tokens(token_mgr.encode(text), 10)
+        self.assertGreater(len(chunks), 1)
+        self.assertNotIn('\ufffd', "".join(chunks))
+        self.assertEqual("".join(chunks), text)
+
+    def test_unknown_note(self):
+        """Operations on notes without stored tokens fail clearly."""
+        with self.assertRaises(KeyError):
+            self.store.chunk_text(5, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Tests for the vector index.
+"""
+
+import tempfile
+import unittest
+import numpy as np
+from vector_index import HashingEmbedder, VectorIndex
+
+
+class TestVectorIndex(unittest.TestCase):
+    """Test cases for VectorIndex."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.index = VectorIndex(self.tmp.name, dim=64, block_rows=4)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_embedder_normalises(self):
+        """Embeddings are unit length, empty text is all zeros."""
+        vectors = HashingEmbedder(32)(["neural networks", ""])
+        self.assertEqual(vectors.dtype, np.float32)
+        self.assertAlmostEqual(float(np.linalg.norm(vectors[0])), 1.0, places=5)
+        self.assertEqual(float(np.abs(vectors[1]).sum()), 0.0)
+
+    def test_search_ranks_relevant_chunk_first(self):
+        """The chunk sharing words with the query scores highest."""
+        self.index.add(1, ["Neural networks mimic the brain", "Cooking pasta al dente"])
+        self.index.add(2, ["Bread needs yeast and flour"])
+
+        results = self.index.search("neural networks brain", k=2)
+        self.assertEqual(len(results), 2)
+        self.assertEqual((results[0].note_id, results[0].chunk_index), (1, 0))
+        self.assertGreaterEqual(results[0].score, results[1].score)
+
+    def test_blocked_top_k_matches_brute_force(self):
+        """Merging per-block top-k gives the same rows as a full sort."""
+        texts = [f"topic {i % 7} word{i} shared" for i in range(30)]
+        for note_id, text in enumerate(texts):
+            self.index.add(note_id, [text])
+
+        queries = ["topic 3 shared", "word12"]
+        embedded = self.index.embed(texts)
+        for query, results in zip(queries, self.index.search_many(queries, k=5)):
+            scores = embedded @ self.index.embed([query])[0]
+            expected = sorted(scores, reverse=True)[:5]
+            self.assertEqual(len(results), 5)
+            np.testing.assert_allclose([r.score for r in results], expected, rtol=1e-5)
+
+    def test_reopen_uses_memory_map(self):
+        """A reopened index searches the vectors written earlier."""
+        self.index.add(7, ["Flashcards help with recall"])
+        reopened = VectorIndex(self.tmp.name, dim=64)
+        self.assertEqual(len(reopened), 1)
+        self.assertEqual(reopened.search("flashcards recall")[0].note_id, 7)
+
+    def test_remove_hides_rows(self):
+        """Removed notes are never returned, even after reopening."""
+        self.index.add(1, ["Neural networks", "More about neural networks"])
+        self.index.add(2, ["Neural nets again"])
+        self.assertEqual(self.index.remove([1]), 2)
+        self.index.add(1, ["Bread"])
+        for index in (self.index, VectorIndex(self.tmp.name, dim=64)):
+            results = index.search("neural networks", k=10)
+            self.assertEqual([(r.note_id, r.chunk_index) for r in results][:1], [(2, 0)])
+            self.assertEqual(len(results), 2)
+
+    def test_compaction_reclaims_removed_rows(self):
+        """Once enough rows are removed the files are rewritten without them."""
+        index = VectorIndex(self.tmp.name, dim=64, block_rows=4, compact_ratio=0.5)
+        for note_id in range(1, 6):
+            index.add(note_id, [f"note {note_id} chunk {i}" for i in range(2)])
+        index.remove([1, 2])
+        self.assertEqual((index.count, index.dead), (10, 4))
+        index.remove([3])
+        self.assertEqual((index.count, index.dead), (4, 0))
+
+        reopened = VectorIndex(self.tmp.name, dim=64)
+        self.assertEqual(reopened.count, 4)
+        results = reopened.search("note 5 chunk 1", k=10)
+        self.assertEqual({r.note_id for r in results}, {4, 5})
+        self.assertEqual((results[0].note_id, results[0].chunk_index), (5, 1))
+
+    def test_empty_index_and_dimension_check(self):
+        """Empty indexes return no results; dimension mismatches fail."""
+        self.assertEqual(self.index.search("anything"), [])
+        self.index.add(1, ["text"])
+        with self.assertRaises(ValueError):
+            VectorIndex(self.tmp.name, dim=32)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,20 +5,67 @@ Command-line interface for token management and analysis.
 
 import argparse
 import sys
+from config import PERFORMANCE
+from exporter import FORMATS, export
 from token_manager import TokenManager
 import json
 
+def read_batch(paths, batch_size=PERFORMANCE['batch_size']):
+    """Yield (path, text, error) for files, reading batch_size files at a time."""
+    batch = []
+    for path in paths:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                batch.append((path, f.read(), None))
+        except (OSError, UnicodeDecodeError) as e:
+            batch.append((path, None, str(e)))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def batch_records(token_mgr, paths, model, parallel=None):
+    """Yield token statistics for each file without keeping earlier files in memory.
+
+    Serial counts share the segment table, so text repeated across files
+    is only encoded once.
+    """
+    model_info = token_mgr.models.get(model, token_mgr.models['gpt-3.5-turbo'])
+    for batch in read_batch(paths):
+        texts = [text for _, text, error in batch if error is None]
+        if parallel is not None:
+            counts = iter(parallel.count_many(texts))
+        else:
+            counts = (token_mgr.count_tokens(text, model, dedup=True) for text in texts)
+        for path, text, error in batch:
+            if error is not None:
+                yield {'file': path, 'error': error}
+                continue
+            tokens = next(counts)
+            yield {
+                'file': path,
+                'tokens': tokens,
+                'words': len(text.split()),
+                'characters': len(text),
+                'cost': (tokens / 1000) * model_info['input_cost_per_1k']
+            }
+
 def main():
     parser = argparse.ArgumentParser(description='Token Manager CLI')
     parser.add_argument('--text', '-t', help='Text to analyze')
-    parser.add_argument('--file', '-f', help='File to analyze')
+    parser.add_argument('--file', '-f', nargs='+',
+                       help='File to analyze (several files with --action batch)')
     parser.add_argument('--model', '-m', default='gpt-3.5-turbo', 
                        help='AI model to use for token counting')
-    parser.add_argument('--action', '-a', choices=['count', 'analyze', 'check', 'chunk', 'optimize', 'models'],
+    parser.add_argument('--action', '-a', choices=['count', 'analyze', 'check', 'chunk', 'optimize', 'batch', 'models'],
                        default='analyze', help='Action to perform')
     parser.add_argument('--max-tokens', type=int, help='Maximum tokens for chunking/optimization')
-    parser.add_argument('--output', '-o', choices=['text', 'json'], default='text',
+    parser.add_argument('--output', '-o', choices=FORMATS, default='text',
                        help='Output format')
+    parser.add_argument('--out', help='Write chunk or batch output to this file as it is produced')
+    parser.add_argument('--processes', '-p', type=int, default=1,
+                       help='Encode large files on this many processes (count, chunk and batch)')
     
     args = parser.parse_args()
     
@@ -29,13 +76,33 @@ def main():
         print(f"Error initializing token manager: {e}")
         sys.exit(1)
     
+    if args.action == 'batch':
+        if not args.file:
+            print("--file is required for batch")
+            sys.exit(1)
+        try:
+            if args.model not in token_mgr.encoders:
+                raise ValueError(f"Model {args.model} not supported")
+            if args.processes > 1:
+                with token_mgr.parallel_encoder(args.model, args.processes) as parallel:
+                    export_batch(token_mgr, args, parallel)
+            else:
+                export_batch(token_mgr, args)
+        except Exception as e:
+            print(f"Error performing action: {e}", file=sys.stderr)
+            sys.exit(1)
+        return
+    
     # Get text to analyze
     text = ""
     if args.text:
         text = args.text
     elif args.file:
+        if len(args.file) > 1:
+            print("Only --action batch takes several files")
+            sys.exit(1)
         try:
-            with open(args.file, 'r', encoding='utf-8') as f:
+            with open(args.file[0], 'r', encoding='utf-8') as f:
                 text = f.read()
         except Exception as e:
             print(f"Error reading file: {e}")
@@ -47,7 +114,11 @@ def main():
     # Perform requested action
     try:
         if args.action == 'count':
-            result = token_mgr.count_tokens(text, args.model)
+            if args.processes > 1:
+                with token_mgr.parallel_encoder(args.model, args.processes) as parallel:
+                    result = parallel.count_tokens(text)
+            else:
+                result = token_mgr.count_tokens(text, args.model)
             output_result({'tokens': result, 'model': args.model}, args.output)
             
         elif args.action == 'analyze':
@@ -68,13 +139,19 @@ def main():
             if not args.max_tokens:
                 print("--max-tokens is required for chunking")
                 sys.exit(1)
-            chunks = token_mgr.chunk_text(text, args.max_tokens, args.model)
-            output_result({
-                'chunks': chunks,
-                'chunk_count': len(chunks),
-                'max_tokens_per_chunk': args.max_tokens,
-                'model': args.model
-            }, args.output)
+            # Fail before the exporter writes anything
+            if args.model not in token_mgr.encoders:
+                raise ValueError(f"Model {args.model} not supported")
+            if args.processes > 1:
+                with token_mgr.parallel_encoder(args.model, args.processes) as parallel:
+                    tokens = parallel.encode(text)
+                chunks = token_mgr.iter_token_chunks(tokens, args.max_tokens, args.model)
+            else:
+                chunks = token_mgr.iter_chunks(text, args.max_tokens, args.model)
+            # Chunks are written as they are cut, never collected into a list
+            export(chunks, args.out, args.output,
+                   fields={'max_tokens_per_chunk': args.max_tokens, 'model': args.model},
+                   key='chunks', count_field='chunk_count', label='Chunk')
             
         elif args.action == 'optimize':
             if not args.max_tokens:
@@ -101,13 +178,20 @@ def main():
             output_result(model_info, args.output)
             
     except Exception as e:
-        print(f"Error performing action: {e}")
+        print(f"Error performing action: {e}", file=sys.stderr)
         sys.exit(1)
 
+def export_batch(token_mgr, args, parallel=None):
+    """Stream per-file token statistics for --action batch."""
+    export(batch_records(token_mgr, args.file, args.model, parallel), args.out, args.output,
+           fields={'model': args.model}, key='files', count_field='file_count', label='File')
+
 def output_result(result, output_format):
     """Output result in specified format."""
     if output_format == 'json':
         print(json.dumps(result, indent=2))
+    elif output_format in ('jsonl', 'markdown'):
+        export([result], fmt=output_format)
     else:
         if isinstance(result, dict):
             for key, value in result.items():
@@ -1,9 +1,21 @@
 import tiktoken
 import re
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, Iterator, List, Tuple, Optional, Sequence
 from dataclasses import dataclass
 import json
 
+# tiktoken encoding used for each model; Claude models use the GPT
+# encoding as an approximation
+ENCODINGS = {
+    'gpt-3.5-turbo': 'cl100k_base',
+    'gpt-4': 'cl100k_base',
+    'claude-3-sonnet': 'cl100k_base'
+}
+
+def _as_list(tokens: Sequence[int]) -> List[int]:
+    """Convert a token slice (list or NumPy array) to a list of ints."""
+    return tokens.tolist() if hasattr(tokens, 'tolist') else list(tokens)
+
 @dataclass
 class TokenInfo:
     """Information about token usage for a piece of text."""
@@ -39,25 +51,47 @@ class TokenManager:
         # Initialize encoders for different models
         self.encoders = {}
         self._init_encoders()
+        
+        # Shared segment table for deduplicated counting, created on first use
+        self._segment_counter = None
     
     def _init_encoders(self):
         """Initialize token encoders for different models."""
         try:
-            # GPT models use cl100k_base encoding
-            self.encoders['gpt-3.5-turbo'] = tiktoken.get_encoding("cl100k_base")
-            self.encoders['gpt-4'] = tiktoken.get_encoding("cl100k_base")
-            # Claude models can use GPT encoding as approximation
-            self.encoders['claude-3-sonnet'] = tiktoken.get_encoding("cl100k_base")
+            for model, encoding in ENCODINGS.items():
+                self.encoders[model] = tiktoken.get_encoding(encoding)
         except Exception as e:
             print(f"Warning: Could not initialize encoders: {e}")
     
-    def count_tokens(self, text: str, model: str = 'gpt-3.5-turbo') -> int:
-        """Count exact tokens for a given text and model."""
+    def encode(self, text: str, model: str = 'gpt-3.5-turbo') -> List[int]:
+        """Encode text into token IDs for a given model."""
+        if model not in self.encoders:
+            raise ValueError(f"Model {model} not supported")
+        
+        return self.encoders[model].encode(text)
+    
+    def count_tokens(self, text: str, model: str = 'gpt-3.5-turbo', dedup: bool = False) -> int:
+        """Count exact tokens for a given text and model.
+        
+        With dedup=True the text is split into content-defined segments and
+        counts of segments already seen in any document are reused.
+        """
         if model not in self.encoders:
             raise ValueError(f"Model {model} not supported")
         
+        if dedup:
+            return self.segment_counter.count_tokens(text, model)
+        
         return len(self.encoders[model].encode(text))
     
+    @property
+    def segment_counter(self):
+        """Shared segment table used by deduplicated counting."""
+        if self._segment_counter is None:
+            from segment_counter import SegmentCounter
+            self._segment_counter = SegmentCounter(self)
+        return self._segment_counter
+    
     def estimate_tokens(self, text: str, content_type: str = 'text') -> int:
         """Estimate token count based on content type."""
         if content_type == 'text':
@@ -93,9 +127,13 @@ class TokenManager:
             model=model
         )
     
-    def check_context_limit(self, text: str, model: str = 'gpt-3.5-turbo') -> Dict:
-        """Check if text fits within model's context window."""
-        token_count = self.count_tokens(text, model)
+    def check_context_limit(self, text: str, model: str = 'gpt-3.5-turbo',
+                            tokens: Optional[Sequence[int]] = None) -> Dict:
+        """Check if text fits within model's context window.
+        
+        Pass already encoded tokens (e.g. from a TokenStore) to skip encoding.
+        """
+        token_count = len(tokens) if tokens is not None else self.count_tokens(text, model)
         model_info = self.models.get(model, self.models['gpt-3.5-turbo'])
         context_window = model_info['context_window']
         
@@ -107,9 +145,21 @@ class TokenManager:
             'overflow_percentage': (token_count / context_window) * 100 if context_window > 0 else 0
         }
     
-    def chunk_text(self, text: str, max_tokens: int, model: str = 'gpt-3.5-turbo') -> List[str]:
-        """Split text into chunks that fit within token limit."""
-        chunks = []
+    def chunk_text(self, text: str, max_tokens: int, model: str = 'gpt-3.5-turbo',
+                   tokens: Optional[Sequence[int]] = None) -> List[str]:
+        """Split text into chunks that fit within token limit.
+        
+        Pass already encoded tokens to slice them instead of re-encoding.
+        """
+        return list(self.iter_chunks(text, max_tokens, model, tokens))
+    
+    def iter_chunks(self, text: str, max_tokens: int, model: str = 'gpt-3.5-turbo',
+                    tokens: Optional[Sequence[int]] = None) -> Iterator[str]:
+        """Yield the chunks of chunk_text one at a time."""
+        if tokens is not None:
+            yield from self.iter_token_chunks(tokens, max_tokens, model)
+            return
+        
         current_chunk = ""
         current_tokens = 0
         
@@ -128,38 +178,114 @@ class TokenManager:
                 current_tokens += sentence_tokens
             else:
                 if current_chunk:
-                    chunks.append(current_chunk.strip())
+                    yield current_chunk.strip()
                 current_chunk = sentence + ". "
                 current_tokens = sentence_tokens
         
         if current_chunk:
-            chunks.append(current_chunk.strip())
+            yield current_chunk.strip()
+    
+    def chunk_tokens(self, tokens: Sequence[int], max_tokens: int,
+                     model: str = 'gpt-3.5-turbo') -> List[str]:
+        """Split encoded text into chunks of at most max_tokens tokens.
         
-        return chunks
+        Chunks end after a sentence where one closes in the second half of
+        the window; only the returned slices and those candidate tokens are
+        decoded.
+        """
+        return list(self.iter_token_chunks(tokens, max_tokens, model))
     
-    def optimize_prompt(self, prompt: str, target_tokens: int, model: str = 'gpt-3.5-turbo') -> str:
-        """Optimize prompt to fit within target token count."""
-        current_tokens = self.count_tokens(prompt, model)
+    def iter_token_chunks(self, tokens: Sequence[int], max_tokens: int,
+                          model: str = 'gpt-3.5-turbo') -> Iterator[str]:
+        """Yield the chunks of chunk_tokens one at a time."""
+        if model not in self.encoders:
+            raise ValueError(f"Model {model} not supported")
+        encoder = self.encoders[model]
         
-        if current_tokens <= target_tokens:
-            return prompt
+        start = 0
+        while start < len(tokens):
+            end = min(start + max_tokens, len(tokens))
+            if end < len(tokens):
+                for cut in range(end, start + max_tokens // 2, -1):
+                    if re.search(r'[.!?]\s*$', encoder.decode([int(tokens[cut - 1])])):
+                        end = cut
+                        break
+            
+            chunk = encoder.decode(_as_list(tokens[start:end]))
+            # Back off rather than split a multi-byte character across chunks
+            while end < len(tokens) and end - start > 1 and chunk.endswith('\ufffd'):
+                end -= 1
+                chunk = encoder.decode(_as_list(tokens[start:end]))
+            chunk = chunk.strip()
+            if chunk:
+                yield chunk
+            start = end
+    
+    def optimize_prompt(self, prompt: str, target_tokens: int, model: str = 'gpt-3.5-turbo',
+                        tokens: Optional[Sequence[int]] = None) -> str:
+        """Optimize prompt to fit within target token count.
         
-        # Try to reduce tokens by removing unnecessary words
-        words = prompt.split()
-        optimized_words = []
-        current_count = 0
+        Lossless compaction (whitespace, repeats, markdown noise) is tried
+        first; words are only cut off the end if that is not enough. Pass
+        already encoded tokens to cut the prompt without re-encoding it.
+        """
+        if tokens is not None:
+            return self._truncate_tokens(prompt, tokens, target_tokens, model)
         
-        for word in words:
-            test_prompt = " ".join(optimized_words + [word])
-            test_tokens = self.count_tokens(test_prompt, model)
-            
-            if test_tokens <= target_tokens:
-                optimized_words.append(word)
-                current_count = test_tokens
-            else:
-                break
+        if model not in self.encoders:
+            raise ValueError(f"Model {model} not supported")
         
-        return " ".join(optimized_words)
+        from config import COMPACTION
+        result = self.compact_prompt(prompt, target_tokens, model,
+                                     steps=COMPACTION['optimize_steps'])
+        if result.token_count <= target_tokens:
+            return result.text
+        
+        tokens = self.encode(result.text, model)
+        return self._truncate_tokens(result.text, tokens, target_tokens, model)
+    
+    def compact_prompt(self, prompt: str, target_tokens: Optional[int] = None,
+                       model: str = 'gpt-3.5-turbo', steps: Optional[List[str]] = None):
+        """Apply token-saving rewrites until the prompt fits target_tokens.
+        
+        Returns a CompactionResult; its expand() restores shortened URLs and IDs.
+        """
+        from prompt_compactor import PromptCompactor
+        return PromptCompactor(self, model, steps).compact(prompt, target_tokens)
+    
+    def _truncate_tokens(self, prompt: str, tokens: Sequence[int], target_tokens: int,
+                         model: str) -> str:
+        """Keep the whole words of the first target_tokens tokens.
+        
+        Only the kept tokens and the one after them are decoded; nothing is
+        re-encoded. prompt may be None, in which case short token lists are
+        decoded whole.
+        """
+        encoder = self.encoders[model]
+        if len(tokens) <= target_tokens:
+            return prompt if prompt is not None else encoder.decode(_as_list(tokens))
+        if target_tokens <= 0:
+            return ""
+        
+        prefix = encoder.decode(_as_list(tokens[:target_tokens]))
+        # Drop the last word if the cut falls inside it (or inside a character)
+        next_token = encoder.decode([int(tokens[target_tokens])])
+        if not prefix[-1:].isspace() and not next_token[:1].isspace():
+            match = re.search(r'\s\S*$', prefix)
+            prefix = prefix[:match.start()] if match else ""
+        return prefix.rstrip()
+    
+    def compile_template(self, template: str, model: str = 'gpt-3.5-turbo',
+                         max_tokens: Optional[int] = None,
+                         budgets: Optional[Dict[str, int]] = None):
+        """Compile a prompt template so renders only encode the slot values."""
+        from prompt_templates import PromptTemplate
+        return PromptTemplate(self, template, model, max_tokens, budgets)
+    
+    def parallel_encoder(self, model: str = 'gpt-3.5-turbo', processes: Optional[int] = None):
+        """Create a process pool that encodes documents through shared memory."""
+        from parallel_encoder import ParallelEncoder
+        return ParallelEncoder(self, model, processes)
     
     def get_model_info(self, model: str) -> Dict:
         """Get information about a specific model."""
@@ -0,0 +1,128 @@
+"""
+Persistent store of encoded notes.
+
+Each note's token IDs are appended as a uint32 array to one binary file
+per model and located through an offset index keyed by note id and
+content hash. Reads are slices of a memory map, so chunking, truncation
+and context checks on stored notes never re-encode them.
+"""
+
+import hashlib
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+INDEX_DTYPE = np.dtype([('note_id', '<i8'), ('offset', '<u8'), ('length', '<u8'), ('hash', 'S16')])
+
+
+def content_hash(text: str) -> bytes:
+    """Return the hash used to detect changed notes."""
+    return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+
+class TokenStore:
+    """Token IDs of notes stored as memory-mapped uint32 arrays."""
+
+    def __init__(self, data_dir: str, token_mgr, model: str = 'gpt-3.5-turbo'):
+        if model not in token_mgr.encoders:
+            raise ValueError(f"Model {model} not supported")
+
+        self.data_dir = data_dir
+        self.token_mgr = token_mgr
+        self.model = model
+        self.data_path = os.path.join(data_dir, f'tokens-{model}.bin')
+        self.index_path = os.path.join(data_dir, f'tokens-{model}.idx')
+
+        # note_id -> (offset, length, content hash); offsets count tokens
+        self.index: Dict[int, Tuple[int, int, bytes]] = {}
+        self.size = 0
+        self._map = None
+        self._load()
+
+    def _load(self):
+        """Read the offset index; later records replace earlier ones."""
+        if not os.path.exists(self.index_path):
+            return
+        records = np.fromfile(self.index_path, dtype=INDEX_DTYPE)
+        for note_id, offset, length, digest in records.tolist():
+            self.index[note_id] = (offset, length, digest)
+        if len(records):
+            self.size = int((records['offset'] + records['length']).max())
+
+    def _tokens(self, offset: int, length: int) -> np.ndarray:
+        """Return a zero-copy view of stored tokens."""
+        if length == 0:
+            return np.zeros(0, dtype=np.uint32)
+        if self._map is None or len(self._map) < offset + length:
+            self._map = np.memmap(self.data_path, dtype=np.uint32, mode='r', shape=(self.size,))
+        return self._map[offset:offset + length]
+
+    def put(self, note_id: int, text: str, tokens: Optional[List[int]] = None) -> np.ndarray:
+        """Store a note's tokens unless the stored ones are current.
+
+        Pass tokens if the text has already been encoded for this model.
+        """
+        digest = content_hash(text)
+        entry = self.index.get(note_id)
+        if entry is not None and entry[2] == digest:
+            return self._tokens(entry[0], entry[1])
+
+        if tokens is None:
+            tokens = self.token_mgr.encode(text, self.model)
+        tokens = np.asarray(tokens, dtype=np.uint32)
+        os.makedirs(self.data_dir, exist_ok=True)
+        with open(self.data_path, 'ab') as f:
+            # Drop tokens left behind by an interrupted put
+            f.truncate(self.size * tokens.itemsize)
+            f.write(tokens.tobytes())
+
+        record = np.array([(note_id, self.size, len(tokens), digest)], dtype=INDEX_DTYPE)
+        with open(self.index_path, 'ab') as f:
+            f.write(record.tobytes())
+
+        self.index[note_id] = (self.size, len(tokens), digest)
+        self.size += len(tokens)
+        return tokens
+
+    def get(self, note_id: int, text: Optional[str] = None) -> Optional[np.ndarray]:
+        """Return the stored tokens of a note.
+
+        If text is given and no longer matches the stored hash, the note is
+        re-encoded first. Returns None for unknown notes without text.
+        """
+        if text is not None:
+            return self.put(note_id, text)
+        entry = self.index.get(note_id)
+        if entry is None:
+            return None
+        return self._tokens(entry[0], entry[1])
+
+    def count_tokens(self, note_id: int) -> int:
+        """Token count of a stored note, from the index alone."""
+        return self.index[note_id][1]
+
+    def chunk_text(self, note_id: int, max_tokens: int) -> List[str]:
+        """Chunk a stored note by slicing its tokens."""
+        return self.token_mgr.chunk_tokens(self._require(note_id), max_tokens, self.model)
+
+    def optimize_prompt(self, note_id: int, target_tokens: int) -> str:
+        """Cut a stored note to target_tokens, decoding only the kept tokens."""
+        return self.token_mgr.optimize_prompt(None, target_tokens, self.model,
+                                              tokens=self._require(note_id))
+
+    def check_context_limit(self, note_id: int) -> Dict:
+        """Check a stored note against the model's context window."""
+        return self.token_mgr.check_context_limit(None, self.model, tokens=self._require(note_id))
+
+    def _require(self, note_id: int) -> np.ndarray:
+        tokens = self.get(note_id)
+        if tokens is None:
+            raise KeyError(f"Note {note_id} has no stored tokens")
+        return tokens
+
+    def __contains__(self, note_id: int) -> bool:
+        return note_id in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
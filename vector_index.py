@@ -0,0 +1,230 @@
+"""
+Vector index for semantic note search.
+
+Chunk embeddings are kept in one contiguous float32 matrix on disk and
+memory-mapped at search time, so opening the index does not read it.
+Queries are scored with blocked NumPy matrix products and the best rows
+are picked with argpartition instead of a full sort. Removed rows keep
+their place in the matrix and are marked with a note id of -1 until
+enough of them pile up, then compaction rewrites the files without them.
+"""
+
+import json
+import os
+import re
+import zlib
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Optional
+
+import numpy as np
+
+from config import SEARCH
+
+EmbedFunction = Callable[[List[str]], np.ndarray]
+
+
+@dataclass
+class SearchResult:
+    """A chunk matching a search query."""
+    note_id: int
+    chunk_index: int
+    score: float
+
+
+class HashingEmbedder:
+    """Offline embedder using hashed word features with TF weighting.
+
+    Words are hashed into a fixed number of signed buckets, weighted by
+    sublinear term frequency and L2-normalised, so dot products are cosine
+    similarities. Needs no model download or vocabulary.
+    """
+
+    def __init__(self, dim: int = SEARCH['embedding_dim']):
+        self.dim = dim
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+
+        for row, text in enumerate(texts):
+            counts = {}
+            for word in re.findall(r"\w+", text.lower()):
+                counts[word] = counts.get(word, 0) + 1
+
+            for word, count in counts.items():
+                bucket = zlib.crc32(word.encode('utf-8'))
+                sign = 1.0 if bucket & 0x80000000 else -1.0
+                vectors[row, bucket % self.dim] += sign * (1.0 + np.log(count))
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+class VectorIndex:
+    """Append-only on-disk index of chunk embeddings."""
+
+    def __init__(self, data_dir: str, embed: Optional[EmbedFunction] = None,
+                 dim: int = SEARCH['embedding_dim'], block_rows: int = SEARCH['block_rows'],
+                 compact_ratio: float = SEARCH['compact_ratio']):
+        self.data_dir = data_dir
+        self.vectors_path = os.path.join(data_dir, 'vectors.f32')
+        self.ids_path = os.path.join(data_dir, 'vectors.ids')
+        self.meta_path = os.path.join(data_dir, 'vectors.json')
+        self.embed = embed or HashingEmbedder(dim)
+        self.dim = dim
+        self.block_rows = block_rows
+        self.compact_ratio = compact_ratio
+        self.count = 0
+        self.dead = 0
+
+        self._matrix = None
+        self._ids = None
+        self._load_meta()
+
+    def _load_meta(self):
+        """Read index dimensions from disk if the index exists."""
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta['dim'] != self.dim:
+            raise ValueError(f"Index has dimension {meta['dim']}, expected {self.dim}")
+        self.count = meta['count']
+        self.dead = meta.get('dead', 0)
+
+    def _save_meta(self):
+        """Write index dimensions to disk."""
+        with open(self.meta_path, 'w', encoding='utf-8') as f:
+            json.dump({'dim': self.dim, 'count': self.count, 'dead': self.dead}, f)
+
+    def _open(self):
+        """Memory-map the embedding matrix and id table."""
+        if self._matrix is None and self.count:
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode='r',
+                                     shape=(self.count, self.dim))
+            self._ids = np.memmap(self.ids_path, dtype=np.int64, mode='r',
+                                  shape=(self.count, 2))
+
+    def add(self, note_id: int, chunks: List[str]):
+        """Embed and append the chunks of a note."""
+        if not chunks:
+            return
+
+        vectors = np.ascontiguousarray(self.embed(chunks), dtype=np.float32)
+        if vectors.shape != (len(chunks), self.dim):
+            raise ValueError(f"Embedding returned shape {vectors.shape}, "
+                             f"expected ({len(chunks)}, {self.dim})")
+        ids = np.array([(note_id, i) for i in range(len(chunks))], dtype=np.int64)
+
+        os.makedirs(self.data_dir, exist_ok=True)
+        for path, rows in ((self.vectors_path, vectors), (self.ids_path, ids)):
+            with open(path, 'ab') as f:
+                # Drop rows left behind by an interrupted add
+                f.truncate(self.count * rows.itemsize * rows.shape[1])
+                f.write(rows.tobytes())
+
+        self.count += len(chunks)
+        self._save_meta()
+        self._matrix = None
+        self._ids = None
+
+    def remove(self, note_ids: Iterable[int]) -> int:
+        """Remove all chunks of the given notes; returns the number of rows removed."""
+        note_ids = np.fromiter(note_ids, dtype=np.int64)
+        if not self.count or not len(note_ids):
+            return 0
+        ids = np.memmap(self.ids_path, dtype=np.int64, mode='r+', shape=(self.count, 2))
+        rows = np.flatnonzero(np.isin(ids[:, 0], note_ids))
+        if len(rows):
+            ids[rows, 0] = -1
+            ids.flush()
+        del ids
+        self._matrix = None
+        self._ids = None
+        if len(rows):
+            self.dead += len(rows)
+            self._save_meta()
+            if self.dead > self.count * self.compact_ratio:
+                self.compact()
+        return len(rows)
+
+    def compact(self) -> int:
+        """Rewrite the index without removed rows; returns the number reclaimed."""
+        if not self.dead:
+            return 0
+        vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r',
+                            shape=(self.count, self.dim))
+        ids = np.memmap(self.ids_path, dtype=np.int64, mode='r', shape=(self.count, 2))
+        kept = 0
+        with open(self.vectors_path + '.tmp', 'wb') as vf, open(self.ids_path + '.tmp', 'wb') as idf:
+            for start in range(0, self.count, self.block_rows):
+                block = ids[start:start + self.block_rows]
+                live = block[:, 0] != -1
+                vf.write(np.ascontiguousarray(vectors[start:start + self.block_rows][live]).tobytes())
+                idf.write(np.ascontiguousarray(block[live]).tobytes())
+                kept += int(live.sum())
+        del vectors, ids
+        self._matrix = None
+        self._ids = None
+
+        os.replace(self.vectors_path + '.tmp', self.vectors_path)
+        os.replace(self.ids_path + '.tmp', self.ids_path)
+        reclaimed = self.count - kept
+        self.count = kept
+        self.dead = 0
+        self._save_meta()
+        return reclaimed
+
+    def search(self, query: str, k: int = SEARCH['top_k']) -> List[SearchResult]:
+        """Return the k chunks most similar to a query."""
+        return self.search_many([query], k)[0]
+
+    def search_many(self, queries: List[str], k: int = SEARCH['top_k']) -> List[List[SearchResult]]:
+        """Return the k most similar chunks for each of several queries."""
+        if not queries:
+            return []
+        if not self.count or k <= 0:
+            return [[] for _ in queries]
+
+        self._open()
+        query_vectors = np.ascontiguousarray(self.embed(queries), dtype=np.float32)
+        k = min(k, self.count)
+
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+
+        for start in range(0, self.count, self.block_rows):
+            block = self._matrix[start:start + self.block_rows]
+            scores = query_vectors @ block.T
+            removed = self._ids[start:start + self.block_rows, 0] < 0
+            if removed.any():
+                scores[:, removed] = -np.inf
+
+            # Keep the best k of this block, then of block + running best
+            if scores.shape[1] > k:
+                top = np.argpartition(scores, -k, axis=1)[:, -k:]
+                scores = np.take_along_axis(scores, top, axis=1)
+                rows = top + start
+            else:
+                rows = np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)
+
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_rows = np.concatenate([best_rows, rows], axis=1)
+            if best_scores.shape[1] > k:
+                top = np.argpartition(best_scores, -k, axis=1)[:, -k:]
+                best_scores = np.take_along_axis(best_scores, top, axis=1)
+                best_rows = np.take_along_axis(best_rows, top, axis=1)
+
+        results = []
+        for scores, rows in zip(best_scores, best_rows):
+            order = np.argsort(-scores)
+            results.append([
+                SearchResult(note_id=int(self._ids[row, 0]), chunk_index=int(self._ids[row, 1]),
+                             score=float(score))
+                for score, row in zip(scores[order], rows[order])
+                if score > -np.inf
+            ])
+        return results
+
+    def __len__(self) -> int:
+        return self.count